@@ -0,0 +1,115 @@
+"""Columnar batch computation of reservation financials.
+
+For bulk jobs (monthly closing, reconciliation) the scalar helpers would run
+once per reservation. Here many DTOs are turned into a struct of arrays
+with money in integer centavos, and the Expedia split, per-category values
+and cost-center totals are computed column by column. All arithmetic is
+integer, so results match the scalar path to the cent.
+"""
+
+from .dto import MONEY_FIELDS
+from .money import EXPEDIA_CLEANING_FEE, EXPEDIA_ISS_RATE, EXPEDIA_COMPANY_COMISSION_RATE, to_cents, mul_ratio
+from .nibo.receivables import RECEIVABLE_DISPATCH
+from .nibo.operational import OPERATIONAL_DISPATCH
+from .nibo.comission import COMISSION_DISPATCH
+
+DISPATCHES = {
+    "receivable": RECEIVABLE_DISPATCH,
+    "operational": OPERATIONAL_DISPATCH,
+    "comission": COMISSION_DISPATCH,
+}
+
+
+class ReservationBatch:
+    """Struct-of-arrays view of many ReservationDTOs.
+
+    `columns` maps every money field to a list of centavos; `rows` keeps the
+    source DTOs for the few rule conditions that look at non-money fields.
+    """
+
+    __slots__ = ("rows", "reservation_ids", "partner_names", "columns")
+
+    def __init__(self, reservation_dtos):
+        self.rows = list(reservation_dtos)
+        self.reservation_ids = [dto.reservation_id for dto in self.rows]
+        self.partner_names = [dto.partner_name for dto in self.rows]
+        self.columns = {
+            field: [getattr(dto, field) for dto in self.rows]
+            for field in MONEY_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def calculate_expedia_batch(batch):
+    """Vectorized calculate_expedia: updates the Expedia rows of the batch in place."""
+    columns = batch.columns
+    mask = [partner == "API expedia" for partner in batch.partner_names]
+    cleaning_fee = to_cents(EXPEDIA_CLEANING_FEE)
+
+    balance = [total - cleaning_fee for total in columns["reserve_total"]]
+    iss = [mul_ratio(value, *EXPEDIA_ISS_RATE) for value in balance]
+    balance = [value - tax for value, tax in zip(balance, iss)]
+    company_comission = [mul_ratio(value, *EXPEDIA_COMPANY_COMISSION_RATE) for value in balance]
+    buy_price = [value - comission for value, comission in zip(balance, company_comission)]
+
+    for field, computed in (
+        ("cleaning_fee", [cleaning_fee] * len(batch)),
+        ("iss", iss),
+        ("company_comission", company_comission),
+        ("buy_price", buy_price),
+    ):
+        columns[field] = [new if selected else old for selected, new, old in zip(mask, computed, columns[field])]
+
+    return batch
+
+
+def _select_variants(batch, dispatch):
+    """Group row indexes by the rule variant that applies to them."""
+    groups = {}
+
+    for index, partner in enumerate(batch.partner_names):
+        variants = dispatch.get(partner)
+        if variants is None:
+            continue
+
+        for variant in variants:
+            when = variant[0]
+            if when is None or when(batch.rows[index]):
+                groups.setdefault(id(variant), (variant, []))[1].append(index)
+                break
+
+    return groups.values()
+
+
+def compute_categories_batch(batch, kind):
+    """Per-category values and cost-center totals for every row of the batch.
+
+    Returns {"categories": {category_id: [centavos]}, "center_cost": [centavos]}
+    where a category appearing several times on a schedule is summed, and
+    rows without the category hold 0.
+    """
+    size = len(batch)
+    categories = {}
+    center_cost = [0] * size
+
+    for variant, indexes in _select_variants(batch, DISPATCHES[kind]):
+        for category_id, field, condition in variant[2]:
+            column = batch.columns[field]
+            values = categories.setdefault(category_id, [0] * size)
+
+            for index in indexes:
+                value = column[index]
+                if value > 0 and (condition is None or condition(batch.rows[index])):
+                    values[index] += value
+                    center_cost[index] += value
+
+    return {"categories": categories, "center_cost": center_cost}
+
+
+def compute_batch(reservation_dtos, kinds=("receivable", "operational", "comission")):
+    """Run the Expedia split and category computation for many DTOs at once."""
+    batch = calculate_expedia_batch(ReservationBatch(reservation_dtos))
+
+    return batch, {kind: compute_categories_batch(batch, kind) for kind in kinds}
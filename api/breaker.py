@@ -0,0 +1,122 @@
+"""Per-upstream circuit breakers.
+
+A breaker watches the outcome of recent calls to one upstream. When too many
+of them fail (errors, 5xx, or slower than the latency threshold) it opens and
+calls fail fast with CircuitOpenError instead of waiting for timeouts. After
+`open_seconds` it lets a single probe through (half-open); a successful probe
+closes it again, a failed one reopens it.
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name):
+        super().__init__(f"Circuit breaker for {name} is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window_seconds=60,
+                 slow_call_seconds=5.0, open_seconds=30, max_window_calls=50):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=max_window_calls)  # (timestamp, failed)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def allow(self):
+        """Whether a call may go through now. Half-open lets one probe at a time."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+
+            if state == CLOSED:
+                return True
+
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+
+    def record(self, failed, elapsed=0.0, slow_after=None):
+        """Record the outcome of a call that was allowed through.
+
+        A call slower than `slow_after` counts as failed. Callers pass the
+        endpoint's own limit; `slow_call_seconds` applies when they have none.
+        """
+        if slow_after is None:
+            slow_after = self.slow_call_seconds
+        failed = failed or elapsed > slow_after
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._current_state(now)
+
+            if state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._trip(now)
+                else:
+                    self._state = CLOSED
+                    self._calls.clear()
+                return
+
+            self._calls.append((now, failed))
+            self._trim(now)
+
+            if state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_failed in self._calls if call_failed)
+                if failures / len(self._calls) >= self.failure_rate:
+                    self._trip(now)
+
+    def _trip(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            failures = sum(1 for _, failed in self._calls if failed)
+            return {
+                "state": self._current_state(now),
+                "recent_calls": len(self._calls),
+                "recent_failures": failures,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,173 @@
+"""Cached catalog of Stays listings and clients.
+
+Cost center and owner resolution key on the stable Stays ids (`_idlisting`,
+the client `_id`) and read the current names from here, instead of trusting
+the name copied into each export report. Entries are kept in two tiers:
+
+  - per instance, in memory, for CATALOG_MEMORY_TTL seconds;
+  - in the stays_catalog table, shared by every instance, for
+    STAYS_CATALOG_TTL seconds. Listings are refreshed there in bulk by the
+    refresh-stays-catalog cron; clients are fetched one by one when missing.
+
+listing.* webhooks invalidate the listing so a rename is picked up by the
+next reservation. Like the other DB helpers these functions never raise: a
+failed lookup returns None and callers fall back to the report's names.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .constants import STAYS_CATALOG_TTL
+from .stays.index import get_listing, get_client, list_listings
+
+logger = logging.getLogger(__name__)
+
+# Short, so instances that didn't receive an invalidation don't lag long
+CATALOG_MEMORY_TTL = 300  # seconds
+REFRESH_PAGE_SIZE = 20
+REFRESH_TIME_BUDGET = 40  # seconds - leaves room under Vercel's maxDuration
+
+# kind -> (fetch one by id, field holding its name)
+CATALOG_KINDS = {
+    "listing": (get_listing, "internalName"),
+    "client": (get_client, "name"),
+}
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+def _remember(kind, stays_id, name):
+    with _memory_lock:
+        _memory[(kind, stays_id)] = (time.monotonic() + CATALOG_MEMORY_TTL, name)
+
+
+def _recall(kind, stays_id):
+    with _memory_lock:
+        cached = _memory.get((kind, stays_id))
+        if cached is None:
+            return None
+        if cached[0] < time.monotonic():
+            del _memory[(kind, stays_id)]
+            return None
+        return cached[1]
+
+
+def _stored(session, kind, stays_id):
+    if not session:
+        return None
+
+    from .models import StaysCatalog
+
+    try:
+        row = session.get(StaysCatalog, (kind, stays_id))
+        if row is None or row.name is None:
+            return None
+        if datetime.now() - datetime.fromisoformat(row.fetched_at) >= timedelta(seconds=STAYS_CATALOG_TTL):
+            return None
+        return row.name
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to read Stays {kind} {stays_id} from the catalog: {e}")
+        return None
+
+
+def _store(session, kind, data, commit=True):
+    from .models import StaysCatalog
+
+    stays_id = str(data["_id"])
+    row = session.get(StaysCatalog, (kind, stays_id)) or StaysCatalog(kind=kind, stays_id=stays_id)
+    row.name = data.get(CATALOG_KINDS[kind][1])
+    row.data = json.dumps(data, ensure_ascii=False)
+    row.fetched_at = datetime.now().isoformat()
+    session.add(row)
+    if commit:
+        session.commit()
+
+
+def catalog_name(session, kind, stays_id):
+    """Current name of a Stays listing (internalName) or client, or None."""
+    if not stays_id:
+        return None
+
+    stays_id = str(stays_id)
+    name = _recall(kind, stays_id) or _stored(session, kind, stays_id)
+
+    if name is None:
+        fetch, name_field = CATALOG_KINDS[kind]
+        try:
+            data = fetch(stays_id)
+        except Exception as e:
+            logger.warning(f"Failed to fetch Stays {kind} {stays_id}: {e}")
+            return None
+
+        name = data.get(name_field) if isinstance(data, dict) else None
+        if name is None:
+            return None
+
+        if session:
+            try:
+                _store(session, kind, {**data, "_id": stays_id})
+            except Exception as e:
+                session.rollback()
+                logger.warning(f"Failed to cache Stays {kind} {stays_id}: {e}")
+
+    _remember(kind, stays_id, name)
+    return name
+
+
+def invalidate_catalog(session, kind, stays_id):
+    """Forget a cached listing or client. Returns False if the DB row could not be removed."""
+    if not stays_id:
+        return False
+
+    stays_id = str(stays_id)
+    with _memory_lock:
+        _memory.pop((kind, stays_id), None)
+
+    if not session:
+        return False
+
+    from .models import StaysCatalog
+
+    try:
+        row = session.get(StaysCatalog, (kind, stays_id))
+        if row is not None:
+            session.delete(row)
+            session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to invalidate Stays {kind} {stays_id}: {e}")
+        return False
+
+
+def refresh_catalog(session):
+    """Cron: reload every listing of the account into the catalog, page by page."""
+    summary = {"pages": 0, "listings": 0, "stopped": None}
+    deadline = time.monotonic() + REFRESH_TIME_BUDGET
+    skip = 0
+
+    while True:
+        if time.monotonic() >= deadline:
+            summary["stopped"] = "time_budget"
+            break
+
+        listings = list_listings(skip=skip, limit=REFRESH_PAGE_SIZE)
+        for listing in listings:
+            if listing.get("_id"):
+                _store(session, "listing", listing, commit=False)
+                if listing.get("internalName"):
+                    _remember("listing", str(listing["_id"]), listing["internalName"])
+        session.commit()
+
+        summary["pages"] += 1
+        summary["listings"] += len(listings)
+        if len(listings) < REFRESH_PAGE_SIZE:
+            break
+        skip += REFRESH_PAGE_SIZE
+
+    return summary
@@ -1,14 +1,51 @@
 from os import getenv
-from dotenv import load_dotenv
 
-load_dotenv()
+# Vercel injects the environment directly; only local runs need a .env file,
+# and this is the single place it is loaded.
+if not getenv("VERCEL"):
+    from dotenv import load_dotenv
+    load_dotenv()
 
+NIBO_ACCOUNT_ID = getenv("NIBO_ACCOUNT_ID")
+NIBO_CLIENT_SECRET = getenv("NIBO_CLIENT_SECRET")
+
+STAYS_SECRET = getenv("STAYS_SECRET")
 STAYS_CLIENT_LOGIN = getenv("STAYS_CLIENT_LOGIN")
 STAYS_CLIENT_SECRET = getenv("STAYS_CLIENT_SECRET")
 
+STAYS_WEBHOOK_MAX_BYTES = int(getenv("STAYS_WEBHOOK_MAX_BYTES", 256 * 1024))
+STAYS_WEBHOOK_VERIFY_SIGNATURE = getenv("STAYS_WEBHOOK_VERIFY_SIGNATURE", "1") != "0"
+
+CRON_SECRET = getenv("CRON_SECRET")
+
+# Seconds to wait for another worker processing the same reservation
+RESERVATION_LOCK_TIMEOUT = float(getenv("RESERVATION_LOCK_TIMEOUT", 20))
+
+# Seconds a mirrored Stays reservation or export report is used before it is
+# fetched again
+RESERVATION_MIRROR_MAX_AGE = float(getenv("RESERVATION_MIRROR_MAX_AGE", 900))
+
+# Seconds a cached Stays listing or client (see api.catalog) is used before
+# it is fetched again
+STAYS_CATALOG_TTL = float(getenv("STAYS_CATALOG_TTL", 24 * 3600))
+
+# Apply queued Nibo writes within the request; "0" leaves them to the
+# dispatch-outbox cron, spreading the load on Nibo
+OUTBOX_DISPATCH_INLINE = getenv("OUTBOX_DISPATCH_INLINE", "1") != "0"
+
+# Fraction of webhook runs profiled (see api.profiling); sampled profiles are
+# kept when the run took at least PROFILE_SLOW_MS. PROFILE_SECRET signs the
+# x-profile-signature header that forces a profile.
+PROFILE_SAMPLE_RATE = float(getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(getenv("PROFILE_SLOW_MS", 20000))
+PROFILE_SECRET = getenv("PROFILE_SECRET")
+
+# Where logs are spooled while the database is down (Vercel only allows /tmp)
+LOG_SPOOL_DIR = getenv("LOG_SPOOL_DIR", "/tmp/stays-nibo-log-spool")
+
 DB_DRIVER = getenv("DB_DRIVER")
 DB_HOST = getenv("DB_HOST")
 DB_PORT = getenv("DB_PORT")
 DB_NAME = getenv("DB_NAME")
 DB_USER = getenv("DB_USER")
-DB_PASSWORD = getenv("DB_PASSWORD")
\ No newline at end of file
+DB_PASSWORD = getenv("DB_PASSWORD")
@@ -0,0 +1,261 @@
+"""Database access for logging and local state.
+
+SQLModel/SQLAlchemy and the Postgres driver are only imported the first time
+a session is requested, so endpoints that never touch the database (health,
+rejected webhooks) don't pay for them on a cold start. The engine is created
+once per instance and reused across invocations.
+
+When a connection fails the database is marked down for DB_RETRY_AFTER
+seconds: sessions are not handed out, connects fail immediately instead of
+waiting for the connect timeout, and log rows go to the disk spool
+(api.spool), which is replayed once a write succeeds again.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .constants import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, RESERVATION_LOCK_TIMEOUT
+from .dryrun import dry_run_active
+from .spool import spool_row, spool_pending, replay_spool
+
+logger = logging.getLogger(__name__)
+
+db_url = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+_engine = None
+_db_down_until = 0.0
+
+DB_RETRY_AFTER = 30  # seconds
+
+# First key of the two-key advisory locks taken per reservation, so they
+# can't collide with advisory locks used for anything else.
+RESERVATION_LOCK_NAMESPACE = 7301
+LOCK_POLL_INTERVAL = 0.2  # seconds
+
+_skip_locks = ContextVar("skip_reservation_locks", default=False)
+
+
+def db_is_down():
+    return time.monotonic() < _db_down_until
+
+
+def mark_db_down(error):
+    global _db_down_until
+
+    if not db_is_down():
+        logger.warning(f"Database marked down for {DB_RETRY_AFTER}s: {error}")
+    _db_down_until = time.monotonic() + DB_RETRY_AFTER
+
+
+def _is_connection_error(error):
+    if isinstance(error, ConnectionError):
+        return True
+
+    try:
+        from sqlalchemy.exc import InterfaceError, OperationalError
+    except ImportError:
+        return False
+
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+def _fail_fast_while_down(dialect, connection_record, cargs, cparams):
+    if db_is_down():
+        raise ConnectionError("Database marked down")
+
+
+def get_engine():
+    global _engine
+
+    if _engine is None:
+        from sqlalchemy import event
+        from sqlmodel import create_engine
+        _engine = create_engine(db_url, connect_args={"connect_timeout": 5}, pool_pre_ping=True)
+        event.listen(_engine, "do_connect", _fail_fast_while_down)
+
+    return _engine
+
+
+def get_db_session():
+    """Try to get a DB session for logging. Returns None if DB is unavailable."""
+    if db_is_down():
+        return None
+
+    try:
+        from sqlmodel import Session
+        return Session(get_engine())
+    except Exception as e:
+        logger.warning(f"DB connection unavailable, skipping logging: {e}")
+        return None
+
+
+def request_log_row(dt, action, payload):
+    return {
+        "dt": dt,
+        "action": action,
+        "payload": json.dumps(payload, ensure_ascii=False),
+    }
+
+
+def log_row(dt, action, payload, internal_payload):
+    return {
+        "dt": dt,
+        "action": action,
+        "payload": json.dumps(payload, ensure_ascii=False),
+        "internal_payload": json.dumps(internal_payload, ensure_ascii=False),
+    }
+
+
+def create_request_log(dt,action,payload,session):
+    from .models import Requests
+
+    Requests(**request_log_row(dt, action, payload)).create(session=session)
+
+
+def create_log(dt,action,payload,internal_payload,session):
+    from .models import Logs
+
+    return Logs(**log_row(dt, action, payload, internal_payload)).create(session=session).id
+
+
+def _write_or_spool(table, row, create, session):
+    """Write a log row to the DB; spool it if the DB is unavailable. Never raises.
+
+    Returns what `create` returned, or None if the row was not written.
+    """
+    if session and not db_is_down():
+        try:
+            created = create()
+        except Exception as e:
+            try:
+                session.rollback()
+            except Exception:
+                pass
+
+            if not _is_connection_error(e):
+                logger.warning(f"Failed to write {table} log: {e}")
+                return
+
+            mark_db_down(e)
+        else:
+            safe_replay_spool(session)
+            return created
+
+    spool_row(table, row)
+    return None
+
+
+def safe_log_request(dt, action, payload, session):
+    """Log request to DB if session is available, else to the disk spool"""
+    _write_or_spool(
+        "requests",
+        request_log_row(dt, action, payload),
+        lambda: create_request_log(dt, action, payload, session),
+        session,
+    )
+
+
+def safe_log(dt, action, payload, internal_payload, session):
+    """Log to DB if session is available, else to the disk spool. Returns the Logs id if written."""
+    return _write_or_spool(
+        "logs",
+        log_row(dt, action, payload, internal_payload),
+        lambda: create_log(dt, action, payload, internal_payload, session),
+        session,
+    )
+
+
+def safe_replay_spool(session):
+    """Load spooled log rows back now that the DB accepts writes. Never raises."""
+    if not spool_pending():
+        return
+
+    try:
+        totals = replay_spool(session)
+        if totals["rows"]:
+            logger.info(f"Replayed {totals['rows']} spooled log rows from {totals['segments']} segments")
+    except Exception as e:
+        logger.warning(f"Failed to replay log spool: {e}")
+
+
+def safe_close_session(session):
+    """Close DB session if it exists"""
+    if session:
+        try:
+            session.close()
+        except Exception:
+            pass
+
+
+@contextmanager
+def skip_reservation_locks():
+    """Take no reservation locks in the block (and its thread).
+
+    For tools whose writes never reach Nibo or the database, such as
+    replays against stand-ins, so they can't hold up live webhooks.
+    """
+    token = _skip_locks.set(True)
+    try:
+        yield
+    finally:
+        _skip_locks.reset(token)
+
+
+@contextmanager
+def reservation_lock(reservation_id, timeout=RESERVATION_LOCK_TIMEOUT):
+    """Hold a Postgres advisory lock on a reservation for the block.
+
+    Yields True once the lock is held. Yields False, and lets the block run
+    unlocked, if the database is unavailable or another worker keeps the
+    lock past `timeout`; callers then fall back to deduplicating afterwards.
+    """
+    connection = None
+    acquired = False
+    params = {"namespace": RESERVATION_LOCK_NAMESPACE, "key": str(reservation_id)}
+
+    # Dry runs and stand-in replays write nothing real: nothing to serialize
+    if dry_run_active() or _skip_locks.get():
+        yield True
+        return
+
+    if db_is_down():
+        yield False
+        return
+
+    try:
+        from sqlalchemy import text
+
+        connection = get_engine().connect()
+        deadline = time.monotonic() + timeout
+
+        while True:
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:namespace, hashtext(:key))"), params).scalar()
+            connection.commit()
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(LOCK_POLL_INTERVAL)
+
+        if not acquired:
+            logger.warning(f"Timed out waiting for the lock on reservation {reservation_id}")
+    except Exception as e:
+        logger.warning(f"Reservation lock unavailable for {reservation_id}: {e}")
+        if _is_connection_error(e):
+            mark_db_down(e)
+        acquired = False
+
+    try:
+        yield bool(acquired)
+    finally:
+        if connection is not None:
+            try:
+                if acquired:
+                    connection.execute(text("SELECT pg_advisory_unlock(:namespace, hashtext(:key))"), params)
+                    connection.commit()
+                connection.close()
+            except Exception as e:
+                # A pooled connection must never keep the session lock
+                logger.warning(f"Failed to release lock on reservation {reservation_id}: {e}")
+                connection.invalidate()
@@ -0,0 +1,106 @@
+"""Retry queue for webhook events that could not run while an upstream was down.
+
+When a circuit breaker is open the webhook stores the event here instead of
+waiting on Stays or Nibo, and the process-deferred-events cron replays it with
+exponential backoff once the breakers close again. Replaying is safe because
+processing is idempotent (existing schedules are updated, not recreated).
+"""
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from .upstream import any_breaker_rejecting
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_MINUTES = 5
+MAX_BACKOFF_MINUTES = 6 * 60
+REPLAY_TIME_BUDGET = 40  # seconds - leaves room under Vercel's maxDuration
+
+
+def _next_attempt_at(attempts):
+    minutes = min(BASE_BACKOFF_MINUTES * 2 ** attempts, MAX_BACKOFF_MINUTES)
+    return (datetime.now() + timedelta(minutes=minutes)).isoformat()
+
+
+def defer_event(session, dt, action, payload, reason):
+    """Queue an event for a later retry. Returns False if it could not be stored."""
+    if not session:
+        return False
+
+    from .models import DeferredEvents
+
+    try:
+        now = datetime.now().isoformat()
+        session.add(DeferredEvents(
+            dt=dt,
+            action=action,
+            payload=json.dumps(payload, ensure_ascii=False),
+            reason=reason,
+            next_attempt_at=now,
+            updated_at=now,
+        ))
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to defer {action} event: {e}")
+        return False
+
+
+def process_deferred_events(session, handle_event, limit=20):
+    """Replay due deferred events through `handle_event(data, session)`.
+
+    `handle_event` returns True when the event was fully processed. Stops early
+    if a breaker opens or the time budget runs out; failed events are retried
+    with backoff and given up on after MAX_ATTEMPTS.
+    """
+    from sqlmodel import select
+    from .models import DeferredEvents
+
+    summary = {"processed": 0, "done": 0, "retrying": 0, "failed": 0, "stopped": None}
+    deadline = time.monotonic() + REPLAY_TIME_BUDGET
+
+    rows = session.exec(
+        select(DeferredEvents)
+        .where(DeferredEvents.status == "pending", DeferredEvents.next_attempt_at <= datetime.now().isoformat())
+        .order_by(DeferredEvents.id)
+        .limit(limit)
+    ).all()
+
+    for row in rows:
+        if any_breaker_rejecting():
+            summary["stopped"] = "circuit_open"
+            break
+        if time.monotonic() >= deadline:
+            summary["stopped"] = "time_budget"
+            break
+
+        data = {"_dt": row.dt, "action": row.action, "payload": json.loads(row.payload)}
+
+        try:
+            succeeded = handle_event(data, session)
+        except Exception as e:
+            logger.warning(f"Deferred event {row.id} failed: {e}")
+            succeeded = False
+
+        row.attempts += 1
+        row.updated_at = datetime.now().isoformat()
+
+        if succeeded:
+            row.status = "done"
+        elif row.attempts >= MAX_ATTEMPTS:
+            row.status = "failed"
+        else:
+            row.next_attempt_at = _next_attempt_at(row.attempts)
+
+        session.add(row)
+        session.commit()
+
+        summary["processed"] += 1
+        summary["done" if row.status == "done" else "failed" if row.status == "failed" else "retrying"] += 1
+
+    return summary
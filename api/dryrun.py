@@ -0,0 +1,64 @@
+"""Dry-run mode: run the pipeline without writing to Nibo.
+
+Inside `with dry_run() as writes:` every Nibo write (any request other than
+a GET) is appended to `writes` instead of being sent, and answered with a
+stand-in success response carrying a fake id, so the pipeline carries on as
+if Nibo had accepted it. Reads still reach Stays and Nibo, so the diff
+against the existing schedules is the real one.
+
+The recorder is a context variable: only the code running inside the block
+(and in its thread) is affected, concurrent requests are not.
+"""
+
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_recorder = ContextVar("dry_run_writes", default=None)
+_fake_ids = itertools.count(1)
+
+
+class RecordedResponse:
+    """Stand-in for the requests.Response of a write that was not sent."""
+
+    def __init__(self, method, fake_id):
+        # Nibo answers updates and deletes with 204, creates with the new id
+        self.status_code = 200 if method == "POST" else 204
+        self.ok = True
+        self.fake_id = fake_id
+        self.text = f'"{fake_id}"'
+
+    def json(self):
+        return {"id": self.fake_id, "scheduleId": self.fake_id}
+
+    def raise_for_status(self):
+        pass
+
+
+@contextmanager
+def dry_run():
+    """Record the Nibo writes of the block instead of sending them. Yields the list."""
+    writes = []
+    token = _recorder.set(writes)
+    try:
+        yield writes
+    finally:
+        _recorder.reset(token)
+
+
+def dry_run_active():
+    return _recorder.get() is not None
+
+
+def record_write(upstream, method, url, json=None, params=None):
+    """Record a write the dry run skipped and return its stand-in response."""
+    fake_id = f"dry-run-{next(_fake_ids)}"
+    _recorder.get().append({
+        "upstream": upstream,
+        "method": method,
+        "url": url,
+        "payload": json,
+        "params": params,
+        "fake_id": fake_id,
+    })
+    return RecordedResponse(method, fake_id)
@@ -0,0 +1,55 @@
+from dataclasses import dataclass, asdict
+
+from .money import from_cents
+
+MONEY_FIELDS = (
+    "cleaning_fee",
+    "electricity_fee",
+    "company_comission",
+    "buy_price",
+    "reserve_total",
+    "total_paid",
+    "service_charge",
+    "iss",
+    "owner_fee",
+)
+
+
+@dataclass(slots=True)
+class ReservationDTO:
+    """Reservation data needed to build the Nibo schedules.
+
+    Money fields are integer centavos (see api.money), so comparing two DTOs
+    or the categories built from them is exact.
+    """
+
+    account_id: str | None
+    reservation_id: str
+    cost_center_id: str | None
+    stakeholder_id: str | None
+    guest_name: str
+    owner_name: str
+    check_in_date: str
+    check_out_date: str
+    partner_name: str
+    listing_internal_name: str
+    creation_date: str
+    listing_id: str = ""  # Stays _idlisting
+    owner_id: str = ""  # Stays client _id
+    supplier_id: str = ""  # Nibo supplier of the owner
+    cleaning_fee: int = 0
+    electricity_fee: int = 0
+    company_comission: int = 0
+    buy_price: int = 0
+    reserve_total: int = 0
+    total_paid: int = 0
+    service_charge: int = 0
+    iss: int = 0
+    owner_fee: int = 0
+
+    def to_dict(self):
+        """Plain dict with money in reais, for logs and JSON output."""
+        data = asdict(self)
+        for field in MONEY_FIELDS:
+            data[field] = from_cents(data[field])
+        return data
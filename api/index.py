@@ -1,58 +1,32 @@
-from typing import Annotated, Optional
-from sqlmodel import Session, create_engine
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, timedelta
+from datetime import datetime
 from pydantic import BaseModel
+import json
 import logging
-
-from .stays.index import get_reservation_report, get_reservation
-from .nibo.transaction import send_transaction, update_transaction, delete_transaction, check_transaction_created, deduplicate_reservation_schedules
-from .utils import create_reservation_dto, calculate_expedia, create_request_log, create_log, validate_header
-from .constants import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME
+import time
+
+from .stays.index import get_reservation
+from .mirror import load_reservation, load_reservation_report, mirror_payload
+from .nibo.transaction import send_transaction, queue_transactions, update_transaction, delete_transaction, check_transaction_created, deduplicate_reservation_schedules, reconcile_reservation_schedules
+from .nibo.outbox import dispatch_reservation_outbox, cancel_reservation_outbox, dispatch_outbox
+from .constants import OUTBOX_DISPATCH_INLINE
+from .utils import LISTING_ACTIONS, WEBHOOK_ACTIONS, create_reservation_dto, calculate_expedia, screen_webhook, webhook_body_too_large, validate_cron_header
+from .money import from_cents
+from .prefilter import PREFILTER_STATS, DELETE_ACTIONS, prefilter_event, is_checkin_date_older_than_one_month
+from .db import get_db_session, safe_log_request, safe_log, safe_close_session, reservation_lock, db_is_down
+from .breaker import CircuitOpenError
+from .upstream import breaker_states, retry_budget_states, any_breaker_open
+from .latency import latency_stats
+from .deferred import defer_event, process_deferred_events
+from .sync import sync_from_export
+from .reconciliation import default_window, scheduled_reconcile
+from .catalog import refresh_catalog, invalidate_catalog
+from .dryrun import dry_run
+from .profiling import profile_run, profile_requested, safe_store_profile
 
 logger = logging.getLogger(__name__)
 
-db_url = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-
-def get_db_session() -> Optional[Session]:
-    """Try to get a DB session for logging. Returns None if DB is unavailable."""
-    try:
-        eng = create_engine(db_url, connect_args={"connect_timeout": 5})
-        session = Session(eng)
-        return session
-    except Exception as e:
-        logger.warning(f"DB connection unavailable, skipping logging: {e}")
-        return None
-
-
-def safe_log_request(dt, action, payload, session):
-    """Log request to DB if session is available"""
-    if session:
-        try:
-            create_request_log(dt, action, payload, session)
-        except Exception as e:
-            logger.warning(f"Failed to log request: {e}")
-
-
-def safe_log(dt, action, payload, internal_payload, session):
-    """Log to DB if session is available"""
-    if session:
-        try:
-            create_log(dt, action, payload, internal_payload, session)
-        except Exception as e:
-            logger.warning(f"Failed to create log: {e}")
-
-
-def safe_close_session(session):
-    """Close DB session if it exists"""
-    if session:
-        try:
-            session.close()
-        except Exception:
-            pass
-
 
 app = FastAPI()
 
@@ -90,22 +64,247 @@ class DeleteReservationResponse(BaseModel):
 
 @app.get("/api/health")
 def health():
-    return { "status": "ready" }
+    return { "status": "ready", "db_down": db_is_down(), "prefilter": PREFILTER_STATS, "breakers": breaker_states(), "retry_budgets": retry_budget_states(), "latency": latency_stats() }
+
+@app.get("/api/cron/reconcile-schedule-map")
+def cron_reconcile_schedule_map(request: Request):
+    """Periodically dedupe schedules and verify the reservation -> schedule id map against Nibo."""
+    if not validate_cron_header(request.headers):
+        raise HTTPException(status_code=403)
+
+    session = get_db_session()
+    if not session:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    try:
+        return reconcile_reservation_schedules(session)
+    finally:
+        safe_close_session(session)
+
+@app.get("/api/cron/dispatch-outbox")
+def cron_dispatch_outbox(request: Request):
+    """Apply Nibo writes left pending in the outbox by failed or crashed workers."""
+    if not validate_cron_header(request.headers):
+        raise HTTPException(status_code=403)
+
+    session = get_db_session()
+    if not session:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    try:
+        return dispatch_outbox(session)
+    finally:
+        safe_close_session(session)
+
+@app.get("/api/cron/sync-reservations")
+def cron_sync_reservations(request: Request):
+    """Catch up on missed webhooks from the reservations export."""
+    if not validate_cron_header(request.headers):
+        raise HTTPException(status_code=403)
+
+    session = get_db_session()
+    if not session:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    try:
+        return sync_from_export(session, sync_export_report)
+    finally:
+        safe_close_session(session)
+
+@app.get("/api/cron/reconcile-nibo")
+def cron_reconcile_nibo(request: Request):
+    """Nightly Stays <-> Nibo diff report (report only; fixes are applied with reconcile_nibo.py --apply).
+
+    Runs under a time budget; a window cut short is picked up by the next run.
+    """
+    if not validate_cron_header(request.headers):
+        raise HTTPException(status_code=403)
+
+    session = get_db_session()
+    try:
+        try:
+            report = scheduled_reconcile(session)
+        except Exception as e:
+            logger.error(f"Nibo reconciliation failed: {e}")
+            safe_log(datetime.now().isoformat(), "reconcile.nibo", {"window": list(default_window())}, {"error": str(e)}, session)
+            raise HTTPException(status_code=500, detail="Reconciliation failed")
+
+        safe_log(datetime.now().isoformat(), "reconcile.nibo", {"window": report["window"]}, report, session)
+    finally:
+        safe_close_session(session)
+
+    return report["summary"]
+
+@app.get("/api/cron/process-deferred-events")
+def cron_process_deferred_events(request: Request):
+    """Replay webhook events deferred while an upstream circuit breaker was open."""
+    if not validate_cron_header(request.headers):
+        raise HTTPException(status_code=403)
+
+    session = get_db_session()
+    if not session:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    try:
+        return process_deferred_events(session, replay_deferred_event)
+    finally:
+        safe_close_session(session)
+
+@app.get("/api/cron/refresh-stays-catalog")
+def cron_refresh_stays_catalog(request: Request):
+    """Reload the cached Stays listings used to resolve cost centers."""
+    if not validate_cron_header(request.headers):
+        raise HTTPException(status_code=403)
+
+    session = get_db_session()
+    if not session:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    try:
+        return refresh_catalog(session)
+    finally:
+        safe_close_session(session)
+
+def _new_transaction_types(reservation_dto, track_log):
+    types = ["receivable", "operational"]
+
+    # Create commission transaction if applicable
+    if reservation_dto.partner_name == "API booking.com" and reservation_dto.total_paid == 0:
+        types.append("comission")
+    else:
+        track_log.append({"step": "commission_check", "partner": reservation_dto.partner_name, "total_paid": from_cents(reservation_dto.total_paid), "result": "skipped"})
+
+    return types
+
+def _send_transactions_directly(reservation_dto, types, track_log, errors, session=None):
+    """Create the schedules one by one, without the outbox (no database)."""
+    for type in types:
+        try:
+            transaction = send_transaction(reservation_dto, type, session)
+            track_log.append({"step": f"send_transaction_{type}", "success": transaction is not False})
+
+            if transaction is False:
+                errors.append(f"Failed to create {type} transaction")
+        except Exception as e:
+            track_log.append({"step": f"send_transaction_{type}", "error": str(e)})
+            errors.append(f"Error creating {type} transaction: {str(e)}")
+
+def _dispatch_outbox(reservation_dto, track_log, errors, session, step):
+    """Apply the reservation's pending outbox rows. Returns False if any is left."""
+    try:
+        results = dispatch_reservation_outbox(session, reservation_dto.reservation_id)
+    except Exception as e:
+        track_log.append({"step": step, "error": str(e)})
+        errors.append(f"Error applying queued transactions: {str(e)}")
+        return False
+
+    for type, done in results.items():
+        track_log.append({"step": f"send_transaction_{type}", "success": done, "via": step})
+        if not done:
+            errors.append(f"Failed to create {type} transaction")
+
+    return all(results.values())
+
+def _resume_outbox(reservation_dto, track_log, session):
+    """Apply the rows queued by an earlier event. Returns the kinds still pending.
+
+    Never fails the event: like the schedule map helpers, a resume that
+    raises (DB errors, no outbox table yet) is only logged.
+    """
+    try:
+        results = dispatch_reservation_outbox(session, reservation_dto.reservation_id)
+    except Exception as e:
+        track_log.append({"step": "outbox_resume", "error": str(e)})
+        return set()
+
+    for type, done in results.items():
+        track_log.append({"step": f"send_transaction_{type}", "success": done, "via": "outbox_resume"})
+
+    return {type for type, done in results.items() if not done}
+
+def sync_reservation_schedules(reservation_report, reservation_dto, track_log, errors, session=None):
+    """Create the reservation schedules in Nibo, or update them if they exist.
+
+    New schedules go through the Nibo outbox when the database is available.
+    Returns False if nothing could be done.
+    """
+    # Writes queued by an earlier event come first, so the check below sees
+    # them. Rows still pending are left to the dispatch-outbox cron and
+    # their kinds are not queued again.
+    still_pending = _resume_outbox(reservation_dto, track_log, session) if session else set()
+
+    try:
+        transaction_exists = check_transaction_created(reservation_dto, session)
+        track_log.append({"step": "check_transaction_exists", "exists": transaction_exists})
+    except Exception as e:
+        track_log.append({"step": "check_transaction_exists", "error": str(e)})
+        errors.append(f"Failed to check if transaction exists: {str(e)}")
+        return False
+
+    if not transaction_exists:
+        track_log.append({"step": "transaction_flow", "type": "create_new"})
+        types = _new_transaction_types(reservation_dto, track_log)
+        if still_pending:
+            types = [type for type in types if type not in still_pending]
+            track_log.append({"step": "outbox_resume", "left_pending": sorted(still_pending)})
+
+        queued = False
+        if session:
+            try:
+                queued = queue_transactions(reservation_dto, types, session)
+                track_log.append({"step": "outbox_enqueue", "types": types, "success": queued})
+            except Exception as e:
+                track_log.append({"step": "outbox_enqueue", "error": str(e)})
+                errors.append(f"Failed to compute transactions: {str(e)}")
+                return False
+
+        if not queued:
+            _send_transactions_directly(reservation_dto, types, track_log, errors, session)
+        elif OUTBOX_DISPATCH_INLINE:
+            _dispatch_outbox(reservation_dto, track_log, errors, session, "outbox_dispatch")
+        else:
+            track_log.append({"step": "outbox_dispatch", "result": "left to the dispatch-outbox cron"})
+    else:
+        track_log.append({"step": "transaction_flow", "type": "update_existing"})
+        try:
+            update_transactions, update_log = update_transaction(reservation_report, reservation_dto, session)
+            track_log.append({"step": "update_transaction", "success": update_transactions is not False, "update_log": update_log})
+            
+            if update_transactions is False:
+                errors.append("Failed to update transaction")
+        except Exception as e:
+            track_log.append({"step": "update_transaction", "error": str(e)})
+            errors.append(f"Error updating transaction: {str(e)}")
+
+    return True
+
+def process_reservation_creation(reservation_data, track_log, errors, session=None, reservation_report=None):
+    """Shared logic for processing reservation creation.
 
-def process_reservation_creation(reservation_data, track_log, errors):
-    """Shared logic for processing reservation creation"""
+    `reservation_report` skips the export fetch when the caller already has it.
+    """
     try:
         track_log.append({"step": "start_processing", "reservation_id": reservation_data.get("id", "unknown")})
         
-        if reservation_data["type"] != "booked":
-            track_log.append({"step": "type_check", "reservation_type": reservation_data["type"], "result": "ignored"})
-            return {"status": "ignored", "reason": f"Reservation type '{reservation_data['type']}' not processed"}
+        # Payload-only ignore rules, evaluated before any upstream request
+        ignore_reason = prefilter_event("reservation.created", reservation_data)
+
+        if ignore_reason == "not_booked":
+            track_log.append({"step": "type_check", "reservation_type": reservation_data.get("type"), "result": "ignored"})
+            return {"status": "ignored", "reason": f"Reservation type '{reservation_data.get('type')}' not processed"}
 
         track_log.append({"step": "type_check", "reservation_type": reservation_data["type"], "result": "accepted"})
 
+        if ignore_reason == "too_old":
+            track_log.append({"step": "date_check", "checkin_date": reservation_data["checkInDate"], "result": "too_old", "source": "payload"})
+            return {"status": "ignored", "reason": "check-in date older than 1 month"}
+
         try:
-            reservation_report = get_reservation_report(reservation_data)
-            track_log.append({"step": "get_reservation_report", "success": reservation_report is not False})
+            if reservation_report is None:
+                reservation_report = load_reservation_report(session, reservation_data)
+                track_log.append({"step": "get_reservation_report", "success": reservation_report is not False})
+            else:
+                track_log.append({"step": "get_reservation_report", "source": "caller"})
         except Exception as e:
             track_log.append({"step": "get_reservation_report", "error": str(e)})
             errors.append(f"Failed to get reservation report: {str(e)}")
@@ -127,7 +326,7 @@ def process_reservation_creation(reservation_data, track_log, errors):
         track_log.append({"step": "date_check", "checkin_date": reservation_report["checkInDate"], "result": "valid"})
 
         try:
-            reservation_dto = create_reservation_dto(reservation_report, reservation_data)
+            reservation_dto = create_reservation_dto(reservation_report, reservation_data, session=session)
             track_log.append({"step": "create_reservation_dto", "success": True})
         except Exception as e:
             track_log.append({"step": "create_reservation_dto", "error": str(e)})
@@ -142,72 +341,24 @@ def process_reservation_creation(reservation_data, track_log, errors):
             errors.append(f"Failed to calculate expedia: {str(e)}")
             return False
 
-        try:
-            transaction_exists = check_transaction_created(reservation_dto)
-            track_log.append({"step": "check_transaction_exists", "exists": transaction_exists})
-        except Exception as e:
-            track_log.append({"step": "check_transaction_exists", "error": str(e)})
-            errors.append(f"Failed to check if transaction exists: {str(e)}")
-            return False
-
-        if not transaction_exists:
-            track_log.append({"step": "transaction_flow", "type": "create_new"})
-            
-            # Create receivable transaction
-            try:
-                receivable_transaction = send_transaction(reservation_dto, "receivable")
-                track_log.append({"step": "send_transaction_receivable", "success": receivable_transaction is not False})
-                
-                if receivable_transaction is False:
-                    errors.append("Failed to create receivable transaction")
-            except Exception as e:
-                track_log.append({"step": "send_transaction_receivable", "error": str(e)})
-                errors.append(f"Error creating receivable transaction: {str(e)}")
+        # Concurrent deliveries of the same reservation serialize here, so the
+        # check-then-create below cannot race and create duplicates.
+        with reservation_lock(reservation_dto.reservation_id) as locked:
+            track_log.append({"step": "reservation_lock", "acquired": locked})
 
-            # Create operational transaction
-            try:
-                operational_transaction = send_transaction(reservation_dto, "operational")
-                track_log.append({"step": "send_transaction_operational", "success": operational_transaction is not False})
+            if sync_reservation_schedules(reservation_report, reservation_dto, track_log, errors, session) is False:
+                return False
 
-                if operational_transaction is False:
-                    errors.append("Failed to create operational transaction")
-            except Exception as e:
-                track_log.append({"step": "send_transaction_operational", "error": str(e)})
-                errors.append(f"Error creating operational transaction: {str(e)}")
-            
-            # Create commission transaction if applicable
-            if reservation_dto["partner_name"] == "API booking.com" and reservation_dto["total_paid"] == 0:
-                try:
-                    comission_transaction = send_transaction(reservation_dto, "comission")
-                    track_log.append({"step": "send_transaction_comission", "success": comission_transaction is not False})
-
-                    if comission_transaction is False:
-                        errors.append("Failed to create commission transaction")
-                except Exception as e:
-                    track_log.append({"step": "send_transaction_comission", "error": str(e)})
-                    errors.append(f"Error creating commission transaction: {str(e)}")
-            else:
-                track_log.append({"step": "commission_check", "partner": reservation_dto.get("partner_name"), "total_paid": reservation_dto.get("total_paid"), "result": "skipped"})
-        else:
-            track_log.append({"step": "transaction_flow", "type": "update_existing"})
+        # Without the lock (DB down or timeout) a concurrent run may have
+        # created the same schedules: fall back to the self-healing dedupe.
+        # With it, leftovers are handled by the periodic reconciler. Never
+        # allowed to break the main flow.
+        if not locked:
             try:
-                update_transactions, update_log = update_transaction(reservation_report, reservation_dto)
-                track_log.append({"step": "update_transaction", "success": update_transactions is not False, "update_log": update_log})
-                
-                if update_transactions is False:
-                    errors.append("Failed to update transaction")
+                dedupe_log = deduplicate_reservation_schedules(reservation_dto, session)
+                track_log.append({"step": "deduplicate_schedules", "removed": len(dedupe_log), "details": dedupe_log})
             except Exception as e:
-                track_log.append({"step": "update_transaction", "error": str(e)})
-                errors.append(f"Error updating transaction: {str(e)}")
-
-        # Self-healing reconciliation: remove any duplicate schedules created by
-        # a concurrent double-delivery of the same Stays event. Never allowed to
-        # break the main flow.
-        try:
-            dedupe_log = deduplicate_reservation_schedules(reservation_dto)
-            track_log.append({"step": "deduplicate_schedules", "removed": len(dedupe_log), "details": dedupe_log})
-        except Exception as e:
-            track_log.append({"step": "deduplicate_schedules", "error": str(e)})
+                track_log.append({"step": "deduplicate_schedules", "error": str(e)})
 
         track_log.append({"step": "processing_complete", "success": True})
         return True
@@ -219,6 +370,27 @@ def process_reservation_creation(reservation_data, track_log, errors):
         errors.append(f"Error processing reservation creation: {str(e)}")
         return False
 
+def simulate_reservation_creation(reservation_data, reservation_report=None):
+    """process_reservation_creation in dry-run mode (see api.dryrun).
+
+    Runs without a database session, so nothing is queued, mapped or logged
+    either. Returns the result with the Nibo writes it would have made.
+    """
+    track_log = []
+    errors = []
+    started = time.perf_counter()
+
+    with dry_run() as writes:
+        result = process_reservation_creation(reservation_data, track_log, errors, None, reservation_report)
+
+    return {
+        "result": result,
+        "errors": errors,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "writes": writes,
+        "track_log": track_log,
+    }
+
 @app.post("/api/create-reservation", response_model=CreateReservationResponse)
 async def create_reservation(request: CreateReservationRequest):
     """
@@ -231,7 +403,7 @@ async def create_reservation(request: CreateReservationRequest):
         errors = []
         
         try:
-            reservation_data = get_reservation(request.reservation_id)
+            reservation_data = load_reservation(session, request.reservation_id)
             track_log.append({"get_reservation": "success"})
         except Exception as e:
             track_log.append({"get_reservation": f"error: {str(e)}"})
@@ -251,7 +423,7 @@ async def create_reservation(request: CreateReservationRequest):
         
         safe_log_request(log_data["_dt"], log_data["action"], log_data["payload"], session)
         
-        result = process_reservation_creation(reservation_data, track_log, errors)
+        result = process_reservation_creation(reservation_data, track_log, errors, session)
         
         safe_log(log_data["_dt"], log_data["action"], log_data["payload"], {"track_log": track_log}, session)
         
@@ -302,7 +474,7 @@ async def delete_reservation(request: DeleteReservationRequest):
         errors = []
         
         try:
-            reservation_data = get_reservation(request.reservation_id)
+            reservation_data = load_reservation(session, request.reservation_id)
             track_log.append({"get_reservation": "success"})
         except Exception as e:
             track_log.append({"get_reservation": f"error: {str(e)}"})
@@ -314,30 +486,25 @@ async def delete_reservation(request: DeleteReservationRequest):
                 errors=[f"API Error: {str(e)}"]
             )
         
-        try:
-            reservation_report = get_reservation_report(reservation_data)
-        except Exception as e:
-            reservation_report = None
-            errors.append(f"Could not get reservation report: {str(e)}")
-        
-        if reservation_report and "checkInDate" in reservation_report:
-            if is_checkin_date_older_than_one_month(reservation_report["checkInDate"]):
-                log_data = {"_dt": datetime.now().isoformat(), "action": "reservation.deleted", "payload": reservation_data}
-                safe_log_request(log_data["_dt"], log_data["action"], log_data["payload"], session)
-                safe_log(log_data["_dt"], log_data["action"], log_data["payload"], {"track_log": track_log}, session)
-                return DeleteReservationResponse(
-                    status="ignored",
-                    message="Reservation ignored - check-in date is older than 1 month",
-                    reservation_id=request.reservation_id,
-                    details={"track_log": track_log},
-                    errors=None
-                )
+        if is_deletion_too_old("reservation.deleted", reservation_data, track_log, session):
+            log_data = {"_dt": datetime.now().isoformat(), "action": "reservation.deleted", "payload": reservation_data}
+            safe_log_request(log_data["_dt"], log_data["action"], log_data["payload"], session)
+            safe_log(log_data["_dt"], log_data["action"], log_data["payload"], {"track_log": track_log}, session)
+            return DeleteReservationResponse(
+                status="ignored",
+                message="Reservation ignored - check-in date is older than 1 month",
+                reservation_id=request.reservation_id,
+                details={"track_log": track_log},
+                errors=None
+            )
         
         log_data = {"_dt": datetime.now().isoformat(), "action": "reservation.deleted", "payload": reservation_data}
         safe_log_request(log_data["_dt"], log_data["action"], log_data["payload"], session)
         
         try:
-            delete_result = delete_transaction(request.reservation_id)
+            with reservation_lock(request.reservation_id):
+                in_flight = cancel_reservation_outbox(session, request.reservation_id)
+                delete_result = delete_transaction(request.reservation_id, session, search_leftovers=in_flight > 0)
             track_log.append({"delete_transaction": delete_result})
             if delete_result is False:
                 errors.append("Failed to delete one or more transactions")
@@ -373,52 +540,177 @@ async def delete_reservation(request: DeleteReservationRequest):
 
 
 
-def is_checkin_date_older_than_one_month(check_in_date_str):
-    """Check if the check-in date is older than 1 month from now"""
-    check_in_date = datetime.strptime(check_in_date_str, "%Y-%m-%d")
-    one_month_ago = datetime.now() - timedelta(days=30)
-    return check_in_date < one_month_ago
+def is_deletion_too_old(action, reservation, track_log, session=None):
+    """Whether a deletion targets a reservation too old to touch.
+
+    Decided from the payload's checkInDate when it is readable; only payloads
+    without one fall back to reading the date from the reservations export.
+    """
+    ignore_reason = prefilter_event(action, reservation)
+    if ignore_reason is not None:
+        track_log.append({"ignored_old_reservation": reservation.get("checkInDate"), "source": "payload"})
+        return True
+
+    if is_checkin_date_older_than_one_month(reservation.get("checkInDate")) is not None:
+        return False
 
-@app.post("/api/stays-webhook")
-async def webhook_reservation(request: Request):
-    session = get_db_session()
     try:
-        data = await request.json()
+        reservation_report = load_reservation_report(session, reservation)
+        track_log.append({"get_reservation_report": reservation_report})
+    except Exception as e:
+        track_log.append({"get_reservation_report_error": str(e)})
+        return False
 
-        safe_log_request(data["_dt"], data["action"], data["payload"], session)
+    if reservation_report and "checkInDate" in reservation_report and is_checkin_date_older_than_one_month(reservation_report["checkInDate"]):
+        track_log.append({"ignored_old_reservation": reservation_report["checkInDate"]})
+        return True
 
-        if not validate_header(request.headers):
-            raise HTTPException(status_code=403)
+    return False
 
-        track_log = []
+def handle_event(data, track_log, errors, session=None):
+    """Process a reservation webhook event. Returns False if it failed."""
+    reservation = data["payload"]
+    track_log.append({"get_payload": reservation})
 
-        if data["action"] in ["reservation.modified", "reservation.created"]:
-            reservation = data["payload"]
-            track_log.append({"get_payload": reservation})
-            errors = []
-            
-            result = process_reservation_creation(reservation, track_log, errors)
+    if data["action"] in ["reservation.modified", "reservation.created"]:
+        return process_reservation_creation(reservation, track_log, errors, session)
+
+    if is_deletion_too_old(data["action"], reservation, track_log, session):
+        return {"status": "ignored", "reason": "check-in date older than 1 month"}
+
+    with reservation_lock(reservation["id"]):
+        in_flight = cancel_reservation_outbox(session, reservation["id"])
+        delete_transactions = delete_transaction(reservation["id"], session, search_leftovers=in_flight > 0)
+    track_log.append({"delete_transaction": delete_transactions})
+
+    return delete_transactions is not False
+
+def run_event(data, track_log, errors, session=None):
+    """handle_event, with an open circuit breaker reported as a failure."""
+    try:
+        return handle_event(data, track_log, errors, session)
+    except CircuitOpenError as e:
+        track_log.append({"step": "circuit_open", "error": str(e)})
+        errors.append(str(e))
+        return False
+
+def current_event(data, session):
+    """The deferred event as it applies now.
+
+    The stored payload may be hours old, so the reservation is loaded again
+    and its current type picks the action: a create retried after the
+    reservation was canceled becomes a cancellation instead of recreating
+    its schedules.
+    """
+    reservation = load_reservation(session, data["payload"]["_id"])
+
+    if not isinstance(reservation, dict) or "_id" not in reservation:
+        # Gone from Stays: only a deletion still applies
+        return {**data, "action": "reservation.deleted"}
+
+    if reservation.get("type") == "booked":
+        return {**data, "action": "reservation.modified", "payload": reservation}
+
+    action = data["action"] if data["action"] in DELETE_ACTIONS else "reservation.canceled"
+    return {**data, "action": action, "payload": reservation}
+
+def replay_deferred_event(data, session):
+    track_log = []
+    errors = []
+
+    try:
+        current = current_event(data, session)
+    except CircuitOpenError:
+        return False
+    track_log.append({"step": "current_state", "stored_action": data["action"], "action": current["action"]})
+
+    result = run_event(current, track_log, errors, session)
+
+    safe_log(data["_dt"], data["action"], data["payload"], {"track_log": track_log, "deferred_replay": True}, session)
+
+    return result is not False and not errors
 
-        elif data["action"] in ["reservation.deleted", "reservation.canceled"]:
-            reservation = data["payload"]
+def sync_export_report(report, session):
+    """Run a changed export report through the pipeline, as its webhook would have."""
+    reservation = get_reservation(report["_id"])
+    mirror_payload(session, reservation)
+    action = "reservation.canceled" if reservation.get("type") == "canceled" else "reservation.modified"
+    data = {"_dt": datetime.now().isoformat(), "action": action, "payload": reservation}
+
+    safe_log_request(data["_dt"], "sync." + action, data["payload"], session)
+
+    track_log = [{"step": "export_sync"}]
+    errors = []
+    try:
+        if action == "reservation.modified":
             track_log.append({"get_payload": reservation})
+            result = process_reservation_creation(reservation, track_log, errors, session, reservation_report=dict(report))
+        else:
+            result = handle_event(data, track_log, errors, session)
+    except CircuitOpenError as e:
+        track_log.append({"step": "circuit_open", "error": str(e)})
+        errors.append(str(e))
+        result = False
 
-            try:
-                reservation_report = get_reservation_report(reservation)
-                track_log.append({"get_reservation_report": reservation_report})
+    safe_log(data["_dt"], "sync." + action, data["payload"], {"track_log": track_log, "errors": errors}, session)
 
-                if reservation_report and "checkInDate" in reservation_report and is_checkin_date_older_than_one_month(reservation_report["checkInDate"]):
-                    track_log.append({"ignored_old_reservation": reservation_report["checkInDate"]})
-                    safe_log(data["_dt"], data["action"], data["payload"], {"track_log": track_log}, session)
-                    return {}
-            except Exception as e:
-                track_log.append({"get_reservation_report_error": str(e)})
+    return result is not False and not errors
 
-            delete_transactions = delete_transaction(reservation["id"])
-            track_log.append({"delete_transaction": delete_transactions})
+@app.post("/api/stays-webhook")
+async def webhook_reservation(request: Request):
+    # Reject oversized, unauthenticated and unhandled traffic on the raw
+    # request, before any JSON parsing or database write.
+    if webhook_body_too_large(request.headers.get("content-length")):
+        raise HTTPException(status_code=413)
+
+    body = await request.body()
 
-        if data["action"] in ["reservation.created", "reservation.modified", "reservation.deleted", "reservation.canceled"]:
-            safe_log(data["_dt"], data["action"], data["payload"], {"track_log": track_log}, session)
+    status, _ = screen_webhook(request.headers, body)
+    if status == 200:
+        return {}
+    if status is not None:
+        raise HTTPException(status_code=status)
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400)
+
+    # The screen only reads the raw body; this is the top-level action
+    if data.get("action") not in WEBHOOK_ACTIONS:
+        return {}
+
+    session = get_db_session()
+    try:
+        safe_log_request(data["_dt"], data["action"], data["payload"], session)
+
+        if data["action"] in LISTING_ACTIONS:
+            listing_id = data["payload"].get("_id")
+            invalidated = invalidate_catalog(session, "listing", listing_id)
+            safe_log(data["_dt"], data["action"], data["payload"], {"track_log": [{"step": "invalidate_catalog", "listing_id": listing_id, "success": invalidated}]}, session)
+            return {}
+
+        mirror_payload(session, data["payload"])
+
+        track_log = []
+        errors = []
+        with profile_run(profile_requested(request.headers, body)) as profile:
+            result = run_event(data, track_log, errors, session)
+
+        # Upstream down: queue the event for the process-deferred-events cron
+        # instead of failing it. Without a database to queue it in, ask Stays
+        # to deliver it again.
+        if (result is False or errors) and any_breaker_open():
+            deferred = defer_event(session, data["_dt"], data["action"], data["payload"], "circuit_open")
+            track_log.append({"step": "deferred", "stored": deferred, "breakers": breaker_states()})
+            log_id = safe_log(data["_dt"], data["action"], data["payload"], {"track_log": track_log}, session)
+            safe_store_profile(session, log_id, data["_dt"], data["action"], profile)
+            if not deferred:
+                raise HTTPException(status_code=503)
+            return {}
+
+        log_id = safe_log(data["_dt"], data["action"], data["payload"], {"track_log": track_log}, session)
+        safe_store_profile(session, log_id, data["_dt"], data["action"], profile)
 
         return {}
     finally:
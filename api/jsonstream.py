@@ -0,0 +1,74 @@
+"""Incremental parsing of a top-level JSON array.
+
+iter_json_array yields the items of `[item, item, ...]` as the bytes arrive,
+so a large export never has to be held in memory as a whole and callers can
+stop reading as soon as they found what they need. Only the item being
+decoded is buffered.
+"""
+
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks):
+    """Yield the items of a JSON array read from an iterable of byte chunks.
+
+    Raises ValueError if the document is not an array (e.g. an error object)
+    or ends before the array is closed.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+
+    buffer = ""
+    position = 0
+    exhausted = False
+    started = False
+
+    def read_more():
+        nonlocal buffer, position, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer = buffer[position:] + utf8.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + utf8.decode(chunk)
+        position = 0
+
+    while True:
+        while position < len(buffer) and (buffer[position] in _WHITESPACE or (started and buffer[position] == ",")):
+            position += 1
+
+        if position >= len(buffer):
+            if exhausted:
+                raise ValueError("JSON array ended unexpectedly")
+            read_more()
+            continue
+
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError(f"Expected a JSON array, got: {buffer[position:position + 200]}")
+            started = True
+            position += 1
+            continue
+
+        if buffer[position] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise ValueError("Invalid JSON in array")
+            read_more()
+            continue
+
+        # A scalar may continue in the next chunk (e.g. a number split in two)
+        if end == len(buffer) and not exhausted and not isinstance(item, (dict, list)):
+            read_more()
+            continue
+
+        position = end
+        yield item
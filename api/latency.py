@@ -0,0 +1,138 @@
+"""Observed latency per upstream endpoint, for adaptive timeouts and hedging.
+
+Each endpoint (upstream, method and URL path with ids stripped) keeps a
+window of recent call durations. Its timeout follows the observed tail
+instead of a fixed value, and its p95 is the delay after which an idempotent
+read may be hedged with a second request. Hedges are capped to a fraction of
+the endpoint's calls so a slow upstream doesn't get twice the load.
+"""
+
+import math
+import re
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+DEFAULT_TIMEOUT = 8  # seconds, until an endpoint has enough samples
+MIN_TIMEOUT = 2
+MAX_TIMEOUT = 25  # exports can be slow; still well under maxDuration
+TIMEOUT_MULTIPLIER = 3  # timeout = p99 x multiplier, clamped
+MIN_SAMPLES = 20
+WINDOW_SIZE = 200
+
+SLOW_MULTIPLIER = 2  # a call is slow for the breaker past p99 x multiplier...
+SLOW_TIMEOUT_FRACTION = 0.8  # ...and always before it would time out
+
+HEDGE_PERCENTILE = 95
+MIN_HEDGE_DELAY = 0.3
+MAX_HEDGE_RATIO = 0.1  # at most one hedge per ten calls
+
+_VERSION_SEGMENT = re.compile(r"^v\d+$")
+_ID_SEGMENT = re.compile(r"\d")
+
+
+def endpoint_key(upstream, method, url):
+    """`nibo GET /empresas/v1/schedules/debit/:id` for a schedule lookup."""
+    segments = []
+    for segment in urlsplit(url).path.split("/"):
+        if segment and not _VERSION_SEGMENT.match(segment) and (_ID_SEGMENT.search(segment) or len(segment) >= 24):
+            segment = ":id"
+        segments.append(segment)
+    return f"{upstream} {method} {'/'.join(segments)}"
+
+
+class LatencyTracker:
+    def __init__(self, window_size=WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window_size)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, elapsed):
+        with self._lock:
+            self._samples.append(elapsed)
+
+    def percentile(self, p):
+        """Nearest-rank percentile of the window, or None without enough samples."""
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+        return ordered[rank]
+
+    def timeout(self):
+        p99 = self.percentile(99)
+        if p99 is None:
+            return DEFAULT_TIMEOUT
+        return min(max(p99 * TIMEOUT_MULTIPLIER, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def slow_threshold(self, timeout):
+        """Seconds past which a call counts as slow for the breaker, or None without enough samples.
+
+        Kept below `timeout`, so a slow call is counted as such instead of only
+        ever failing as a timeout.
+        """
+        p99 = self.percentile(99)
+        if p99 is None:
+            return None
+        return min(p99 * SLOW_MULTIPLIER, timeout * SLOW_TIMEOUT_FRACTION)
+
+    def hedge_delay(self):
+        p95 = self.percentile(HEDGE_PERCENTILE)
+        if p95 is None:
+            return None
+        return max(p95, MIN_HEDGE_DELAY)
+
+    def start_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def take_hedge(self):
+        """Reserve a hedge if the endpoint is under its hedge ratio."""
+        with self._lock:
+            if self.hedged + 1 > self.calls * MAX_HEDGE_RATIO:
+                return False
+            self.hedged += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def snapshot(self):
+        p50, p95, p99 = (self.percentile(p) for p in (50, 95, 99))
+        timeout = self.timeout()
+        slow_after = self.slow_threshold(timeout)
+        with self._lock:
+            return {
+                "samples": len(self._samples),
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "timeout": timeout,
+                "slow_after": slow_after,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def tracker_for(upstream, method, url):
+    key = endpoint_key(upstream, method, url)
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = _trackers[key] = LatencyTracker()
+        return tracker
+
+
+def latency_stats():
+    with _trackers_lock:
+        trackers = dict(_trackers)
+    return {key: tracker.snapshot() for key, tracker in trackers.items()}
@@ -0,0 +1,195 @@
+"""Postgres mirror of Stays reservations.
+
+Keeps, per reservation `_id`, the last reservation payload we saw (from a
+webhook or get_reservation) and its last export report (from any export we
+downloaded: single-listing, sync or reconciliation). Pipeline runs read from
+here and only call Stays when the mirrored data is stale:
+
+  - a payload is fresh for RESERVATION_MIRROR_MAX_AGE seconds;
+  - a report is fresh for the same time, and only if it was fetched after
+    the payload last changed, so a modification always refetches it while
+    redeliveries and retries of the same event don't.
+
+Like the other DB helpers these functions never raise; without a session or
+on DB errors the mirror is simply a miss.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+
+from .constants import RESERVATION_MIRROR_MAX_AGE
+from .singleflight import SingleFlight
+from .stays.index import get_reservation, get_reservation_report, export_reservations
+
+logger = logging.getLogger(__name__)
+
+MIRROR_BATCH_SIZE = 100
+
+# Concurrent misses on the same listing export share one download
+inflight = SingleFlight()
+
+
+def _hash(value):
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _fresh(timestamp, now):
+    return timestamp is not None and now - datetime.fromisoformat(timestamp) < timedelta(seconds=RESERVATION_MIRROR_MAX_AGE)
+
+
+def _find(session, reservation_id):
+    from sqlmodel import select
+    from .models import ReservationMirror
+
+    row = session.get(ReservationMirror, str(reservation_id))
+    if row is None:
+        row = session.exec(select(ReservationMirror).where(ReservationMirror.code == str(reservation_id))).first()
+    return row
+
+
+def mirror_payload(session, reservation):
+    """Store a reservation payload. Returns False if it could not be stored."""
+    if not session or not reservation or "_id" not in reservation:
+        return False
+
+    from .models import ReservationMirror
+
+    try:
+        now = datetime.now().isoformat()
+        payload_hash = _hash(reservation)
+
+        row = session.get(ReservationMirror, str(reservation["_id"])) or ReservationMirror(reservation_id=str(reservation["_id"]))
+        if row.payload_hash != payload_hash:
+            row.payload = json.dumps(reservation, ensure_ascii=False)
+            row.payload_hash = payload_hash
+            row.payload_changed_at = now
+        if reservation.get("id"):
+            row.code = str(reservation["id"])
+        row.payload_at = now
+
+        session.add(row)
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to mirror reservation {reservation.get('_id')}: {e}")
+        return False
+
+
+def mirror_reports(session, reports):
+    """Store the export reports of many reservations in one transaction."""
+    if not session or not reports:
+        return False
+
+    from sqlmodel import select
+    from .models import ReservationMirror
+
+    try:
+        now = datetime.now().isoformat()
+        reports = {str(report["_id"]): report for report in reports if report.get("_id")}
+        rows = session.exec(select(ReservationMirror).where(ReservationMirror.reservation_id.in_(list(reports)))).all()
+        existing = {row.reservation_id: row for row in rows}
+
+        for reservation_id, report in reports.items():
+            row = existing.get(reservation_id) or ReservationMirror(reservation_id=reservation_id)
+            if report.get("id"):
+                row.code = str(report["id"])
+            row.report = json.dumps(report, ensure_ascii=False)
+            row.report_at = now
+            session.add(row)
+
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to mirror {len(reports)} export reports: {e}")
+        return False
+
+
+def mirrored_payload(session, reservation_id):
+    """The mirrored payload of a reservation (`_id` or `id`), or None if stale or unknown."""
+    if not session:
+        return None
+
+    try:
+        row = _find(session, reservation_id)
+        if row is None or row.payload is None or not _fresh(row.payload_at, datetime.now()):
+            return None
+        return json.loads(row.payload)
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to read mirrored reservation {reservation_id}: {e}")
+        return None
+
+
+def mirrored_report(session, reservation_id):
+    """The mirrored export report of a reservation, or None if stale or unknown."""
+    if not session:
+        return None
+
+    try:
+        row = _find(session, reservation_id)
+        if row is None or row.report is None or not _fresh(row.report_at, datetime.now()):
+            return None
+        if row.payload_changed_at is not None and row.report_at < row.payload_changed_at:
+            return None
+        return json.loads(row.report)
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to read mirrored report {reservation_id}: {e}")
+        return None
+
+
+def load_reservation(session, reservation_id):
+    """get_reservation, served from the mirror while it is fresh."""
+    reservation = mirrored_payload(session, reservation_id)
+    if reservation is None:
+        reservation = get_reservation(reservation_id)
+        mirror_payload(session, reservation)
+    return reservation
+
+
+def _mirror_listing_export(session, from_date, to_date, listing_id):
+    """Stream a listing's export into the mirror in batches. Returns {_id: report}
+    of the reports the mirror could not take (none unless it failed)."""
+    unmirrored = {}
+    batch = []
+
+    def flush():
+        if not mirror_reports(session, batch):
+            unmirrored.update((item.get("_id"), item) for item in batch)
+        batch.clear()
+
+    for item in export_reservations(from_date, to_date, listing_id):
+        batch.append(item)
+        if len(batch) >= MIRROR_BATCH_SIZE:
+            flush()
+    flush()
+    return unmirrored
+
+
+def load_reservation_report(session, reservation):
+    """get_reservation_report, served from the mirror while it is fresh.
+
+    On a miss the whole listing export is streamed into the mirror in
+    batches, so the other reservations it contains are fresh too; concurrent
+    misses on the same export share that download and then read the mirror.
+    Without a database the export is only read up to the reservation.
+    """
+    report = mirrored_report(session, reservation["_id"])
+    if report is not None:
+        return report
+
+    if not session:
+        return get_reservation_report(reservation)
+
+    key = ("mirror_listing_export", reservation["checkInDate"], reservation["checkOutDate"], reservation["_idlisting"])
+    unmirrored = inflight.do(key, _mirror_listing_export, session, *key[1:])
+    if reservation["_id"] in unmirrored:
+        return unmirrored[reservation["_id"]]
+
+    report = mirrored_report(session, reservation["_id"])
+    return report if report is not None else False
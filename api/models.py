@@ -0,0 +1,134 @@
+"""Database tables. Imported lazily through api.db so cold starts skip SQLModel."""
+
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+class Requests(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    dt: str = Field(default=None)
+    action: str = Field(default=None)
+    payload: str = Field(default=None)
+
+    def create(self, session):
+        session.add(self)
+        session.commit()
+        session.refresh(self)
+        return self
+    
+class Logs(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    dt: str = Field(default=None)
+    action: str = Field(default=None)
+    payload: str = Field(default=None)
+    internal_payload: str = Field(default=None)
+
+    def create(self, session):
+        session.add(self)
+        session.commit()
+        session.refresh(self)
+        return self
+
+class ScheduleMap(SQLModel, table=True):
+    __tablename__ = "schedule_map"
+    __table_args__ = (UniqueConstraint("reservation_id", "kind"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    reservation_id: str = Field(default=None, index=True)
+    kind: str = Field(default=None)
+    reference: str = Field(default=None)
+    schedule_id: str = Field(default=None)
+    content_hash: str = Field(default="")
+    updated_at: str = Field(default=None)
+
+class DeferredEvents(SQLModel, table=True):
+    __tablename__ = "deferred_events"
+
+    id: int | None = Field(default=None, primary_key=True)
+    dt: str = Field(default=None)
+    action: str = Field(default=None)
+    payload: str = Field(default=None)
+    reason: str = Field(default=None)
+    attempts: int = Field(default=0)
+    next_attempt_at: str = Field(default=None, index=True)
+    status: str = Field(default="pending", index=True)
+    updated_at: str = Field(default=None)
+
+class NiboOutbox(SQLModel, table=True):
+    __tablename__ = "nibo_outbox"
+
+    id: int | None = Field(default=None, primary_key=True)
+    reservation_id: str = Field(default=None, index=True)
+    kind: str = Field(default=None)
+    payload: str = Field(default=None)
+    content_hash: str = Field(default="")
+    status: str = Field(default="pending", index=True)
+    attempts: int = Field(default=0)
+    schedule_id: str | None = Field(default=None)
+    last_error: str | None = Field(default=None)
+    created_at: str = Field(default=None)
+    updated_at: str = Field(default=None)
+
+class SyncState(SQLModel, table=True):
+    __tablename__ = "sync_state"
+
+    key: str = Field(primary_key=True)
+    value: str = Field(default="")
+    updated_at: str = Field(default=None)
+
+class SyncedReservations(SQLModel, table=True):
+    __tablename__ = "synced_reservations"
+
+    reservation_id: str = Field(primary_key=True)
+    content_hash: str = Field(default="")
+    synced_at: str = Field(default=None)
+
+class ReservationMirror(SQLModel, table=True):
+    __tablename__ = "reservation_mirror"
+
+    reservation_id: str = Field(primary_key=True)  # Stays _id
+    code: str | None = Field(default=None, index=True)  # Stays id
+    payload: str | None = Field(default=None)
+    payload_hash: str = Field(default="")
+    payload_at: str | None = Field(default=None)
+    payload_changed_at: str | None = Field(default=None)
+    report: str | None = Field(default=None)
+    report_at: str | None = Field(default=None)
+
+class StaysCatalog(SQLModel, table=True):
+    __tablename__ = "stays_catalog"
+
+    kind: str = Field(primary_key=True)  # "listing" or "client"
+    stays_id: str = Field(primary_key=True)  # Stays _id
+    name: str | None = Field(default=None)
+    data: str | None = Field(default=None)
+    fetched_at: str = Field(default=None)
+
+class EntityMap(SQLModel, table=True):
+    __tablename__ = "entity_map"
+
+    kind: str = Field(primary_key=True)  # "costcenter" or "supplier"
+    stays_id: str = Field(primary_key=True)  # Stays listing or client _id
+    nibo_id: str = Field(default=None)
+    name: str | None = Field(default=None)  # Stays name when it was mapped
+    updated_at: str = Field(default=None)
+
+class StakeholderIndex(SQLModel, table=True):
+    __tablename__ = "stakeholder_index"
+
+    normalized_name: str = Field(primary_key=True)
+    stakeholder_id: str = Field(default=None)
+    name: str | None = Field(default=None)
+    updated_at: str = Field(default=None)
+
+class Profiles(SQLModel, table=True):
+    __tablename__ = "profiles"
+
+    id: int | None = Field(default=None, primary_key=True)
+    log_id: int | None = Field(default=None, foreign_key="logs.id", index=True)
+    dt: str = Field(default=None)
+    action: str = Field(default=None)
+    trigger: str = Field(default=None)  # "header" or "sampled"
+    elapsed_ms: float = Field(default=None)
+    samples: int = Field(default=0)
+    stacks: str = Field(default="")  # folded stacks
+    created_at: str = Field(default=None)
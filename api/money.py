@@ -0,0 +1,22 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Rates as exact integer ratios so money math never goes through floats
+EXPEDIA_CLEANING_FEE = 190
+EXPEDIA_ISS_RATE = (4762, 100000)          # 4.762%
+EXPEDIA_COMPANY_COMISSION_RATE = (25, 100)  # 25%
+
+def to_cents(value):
+    """Convert a money value in reais (int, float, str or Decimal) to integer centavos, rounding half up."""
+    if value is None:
+        return 0
+    cents = Decimal(str(value)) * 100
+    return int(cents.quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Convert integer centavos back to reais for the Nibo payloads."""
+    return cents / 100
+
+def mul_ratio(cents, numerator, denominator):
+    """Multiply centavos by numerator/denominator, rounding half away from zero like ROUND_HALF_UP."""
+    sign = -1 if cents < 0 else 1
+    return sign * ((abs(cents) * numerator * 2 + denominator) // (2 * denominator))
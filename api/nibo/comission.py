@@ -1,36 +1,24 @@
-from datetime import datetime
-
-from .utils import get_next_month_15
-from .constants import CATEGORIES_IDS
 from .index import find_supplier_id
+from .rules import compile_rules, apply_rules
 
-def get_booking_categories(reservation_dto):
-    categories = []
+BOOKING_SUPPLIER_NAME = "BOOKING.COM BRASIL SERVICOS DE RESERVA DE HOTEIS LTDA."
 
-    if reservation_dto["owner_fee"] > 0:
-        categories.append({
-            "categoryId": CATEGORIES_IDS["BOOKING_COMISSION"],
-            "value": reservation_dto["owner_fee"]
-        })
+COMISSION_RULES = {
+    "API booking.com": [
+        {
+            "due_date": ("next_month_15", "check_out"),
+            "categories": [("BOOKING_COMISSION", "owner_fee", None)],
+        },
+    ],
+}
 
-    return categories
+COMISSION_DISPATCH = compile_rules(COMISSION_RULES)
 
 def get_comission_data(reservation_dto, transaction_dto):
     reference = transaction_dto["reference"]
-    check_out_date = datetime.strptime(reservation_dto["check_out_date"], "%Y-%m-%d")
-    dueDate = transaction_dto["dueDate"]
-    scheduleDate = transaction_dto["scheduleDate"]
-    categories = []
 
-    if reservation_dto["partner_name"] == "API booking.com":
-        dueDate = get_next_month_15(check_out_date)
-        scheduleDate = get_next_month_15(check_out_date)
-        categories = get_booking_categories(reservation_dto)
-    
-    transaction_dto["categories"] = categories
-    transaction_dto["dueDate"] = dueDate
-    transaction_dto["scheduleDate"] = scheduleDate
-    transaction_dto["stakeholderId"] = find_supplier_id("BOOKING.COM BRASIL SERVICOS DE RESERVA DE HOTEIS LTDA.")
+    transaction_dto = apply_rules(COMISSION_DISPATCH, reservation_dto, transaction_dto)
+    transaction_dto["stakeholderId"] = find_supplier_id(BOOKING_SUPPLIER_NAME)
     transaction_dto["reference"] = f"{reference}_comissao"
 
-    return transaction_dto
\ No newline at end of file
+    return transaction_dto
@@ -1,10 +1,4 @@
-from os import getenv
-from dotenv import load_dotenv
-
-load_dotenv()
-
-NIBO_ACCOUNT_ID = getenv("NIBO_ACCOUNT_ID")
-NIBO_CLIENT_SECRET = getenv("NIBO_CLIENT_SECRET")
+from ..constants import NIBO_ACCOUNT_ID, NIBO_CLIENT_SECRET
 
 CATEGORIES_IDS = {
     "COMPANY_COMISSION": "f7f5fd10-3853-4596-be05-b6db3edcdc78",
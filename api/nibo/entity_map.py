@@ -0,0 +1,94 @@
+import logging
+import threading
+from datetime import datetime
+
+from .index import find_costcenter_id, find_supplier_id
+from ..dryrun import dry_run_active
+
+logger = logging.getLogger(__name__)
+
+# Stays listings and clients are matched to their Nibo cost center and
+# supplier by Stays id, once. Later reservations read the id from here (an
+# in-memory dict, then the entity_map table) without searching Nibo, and a
+# rename in Stays keeps pointing at the same Nibo record instead of creating
+# a new one under the new name.
+#
+# Like api.nibo.schedule_map, functions taking a session are no-ops without
+# one and never raise.
+
+# Mapping kind -> Nibo search-or-create by name
+ENTITY_KINDS = {
+    "costcenter": find_costcenter_id,
+    "supplier": find_supplier_id,
+}
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+def mapped_entity_id(session, kind, stays_id):
+    """The Nibo id mapped to a Stays id, or None if unknown."""
+    if not stays_id:
+        return None
+
+    stays_id = str(stays_id)
+    with _memory_lock:
+        nibo_id = _memory.get((kind, stays_id))
+    if nibo_id is not None or not session:
+        return nibo_id
+
+    from ..models import EntityMap
+
+    try:
+        row = session.get(EntityMap, (kind, stays_id))
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to read {kind} mapping of {stays_id}: {e}")
+        return None
+
+    if row is None:
+        return None
+
+    with _memory_lock:
+        _memory[(kind, stays_id)] = row.nibo_id
+    return row.nibo_id
+
+
+def record_entity(session, kind, stays_id, nibo_id, name=None):
+    """Map a Stays id to a Nibo id. Returns False if it could not be stored."""
+    # Dry-run ids are fake: caching them would hide the next run's create
+    if not stays_id or not nibo_id or dry_run_active():
+        return False
+
+    stays_id = str(stays_id)
+    with _memory_lock:
+        _memory[(kind, stays_id)] = str(nibo_id)
+
+    if not session:
+        return False
+
+    from ..models import EntityMap
+
+    try:
+        row = session.get(EntityMap, (kind, stays_id)) or EntityMap(kind=kind, stays_id=stays_id)
+        row.nibo_id = str(nibo_id)
+        row.name = name
+        row.updated_at = datetime.now().isoformat()
+        session.add(row)
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to record {kind} mapping of {stays_id}: {e}")
+        return False
+
+
+def resolve_entity_id(session, kind, stays_id, name):
+    """Nibo id of a Stays listing/client: from the map, else found by name and mapped."""
+    nibo_id = mapped_entity_id(session, kind, stays_id)
+    if nibo_id is not None:
+        return nibo_id
+
+    nibo_id = ENTITY_KINDS[kind](name)
+    record_entity(session, kind, stays_id, nibo_id, name)
+    return nibo_id
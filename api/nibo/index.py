@@ -1,37 +1,31 @@
-import requests
-import time
 import logging
 
-from .utils import sanitize_dates
+from ..upstream import upstream_request, MAX_RETRIES
+from ..singleflight import SingleFlight, single_flight
+from ..dryrun import dry_run_active, record_write
+from .utils import sanitize_dates, belongs_to_reservation
 from .constants import NIBO_CLIENT_SECRET
 
 logger = logging.getLogger(__name__)
 
-REQUEST_TIMEOUT = 8  # seconds
-MAX_RETRIES = 2
-
-
-def _nibo_request(method, url, headers, json=None, retries=MAX_RETRIES):
-    """Make HTTP request to Nibo API with timeout and retry"""
-    for attempt in range(retries):
-        try:
-            if method == "GET":
-                response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-            elif method == "POST":
-                response = requests.post(url, json=json, headers=headers, timeout=REQUEST_TIMEOUT)
-            elif method == "PUT":
-                response = requests.put(url, json=json, headers=headers, timeout=REQUEST_TIMEOUT)
-            elif method == "DELETE":
-                response = requests.delete(url, headers=headers, timeout=REQUEST_TIMEOUT)
-            return response
-        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-            if attempt < retries - 1:
-                wait = 1 * (attempt + 1)
-                logger.warning(f"Nibo API retry {attempt+1}/{retries} for {url}: {e}")
-                time.sleep(wait)
-            else:
-                logger.error(f"Nibo API failed after {retries} attempts: {url}: {e}")
-                raise
+# Concurrent identical lookups and get-or-create resolutions share one call
+inflight = SingleFlight()
+
+
+# References used by each logical schedule of a reservation (see
+# belongs_to_reservation): credit holds the receivable, debit holds the
+# operational and comission schedules.
+SCHEDULE_REFERENCE_SUFFIXES = {
+    "credit": ("",),
+    "debit": ("_operacional", "_comissao"),
+}
+
+
+def _nibo_request(method, url, headers, json=None, params=None, retries=MAX_RETRIES, hedge=False):
+    """Make HTTP request to Nibo API with timeout, circuit breaker and retry"""
+    if method != "GET" and dry_run_active():
+        return record_write("nibo", method, url, json=json, params=params)
+    return upstream_request("nibo", method, url, headers, json=json, params=params, retries=retries, hedge=hedge)
 
 def create_debit_schedule(payload):
     url = "https://api.nibo.com.br/empresas/v1/schedules/debit"
@@ -43,7 +37,7 @@ def create_debit_schedule(payload):
     }
 
     payload = sanitize_dates(payload)
-    response = requests.post(url, json=payload, headers=headers)
+    response = _nibo_request("POST", url, headers, json=payload, retries=1)
     response = response.json()
 
     if "error" in response:
@@ -51,8 +45,78 @@ def create_debit_schedule(payload):
 
     return response
 
+def odata_literal(value):
+    """Quote a value as an OData string literal, doubling embedded quotes."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _find_schedules(kind: str, reservation_id: str):
+    """Return the debit/credit schedules of a reservation.
+
+    Queries by exact reference first, so Nibo only returns the rows we need.
+    If the reference query is rejected, falls back to the old
+    contains(description) search and drops its false positives client-side.
+    """
+    url = f"https://api.nibo.com.br/empresas/v1/schedules/{kind}"
+
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "apitoken": NIBO_CLIENT_SECRET
+    }
+
+    references = [f"{reservation_id}{suffix}" for suffix in SCHEDULE_REFERENCE_SUFFIXES[kind]]
+    reference_filter = " or ".join(f"reference eq {odata_literal(reference)}" for reference in references)
+
+    response = _nibo_request("GET", url, headers, params={"$filter": reference_filter}, hedge=True)
+    if response.ok:
+        response = response.json()
+        if "items" in response:
+            return response["items"]
+
+    logger.warning(f"Nibo reference lookup failed for {kind} schedules of {reservation_id}, falling back to description search")
+
+    description_filter = f"contains(description,{odata_literal(reservation_id)})"
+    response = _nibo_request("GET", url, headers, params={"$filter": description_filter}, hedge=True)
+    response = response.json()
+
+    if "statusCode" in response and response["statusCode"] == 404:
+        return False
+
+    return [schedule for schedule in response["items"] if belongs_to_reservation(schedule, reservation_id)]
+
+def list_schedules(kind: str, from_date: str, to_date: str, page_size=500):
+    """All debit/credit schedules accrued between the two dates, following Nibo's paging."""
+    url = f"https://api.nibo.com.br/empresas/v1/schedules/{kind}"
+
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "apitoken": NIBO_CLIENT_SECRET
+    }
+
+    schedules = []
+    while True:
+        params = {
+            "$filter": f"accrualDate ge {from_date} and accrualDate le {to_date}",
+            # scheduleId breaks accrualDate ties, so $skip pages don't overlap or skip rows
+            "$orderby": "accrualDate,scheduleId",
+            "$top": page_size,
+            "$skip": len(schedules),
+        }
+        response = _nibo_request("GET", url, headers, params=params)
+        response.raise_for_status()
+
+        items = response.json().get("items", [])
+        schedules.extend(items)
+
+        if len(items) < page_size:
+            return schedules
+
 def get_debit_schedule(reservation_id: str):
-    url = f"https://api.nibo.com.br/empresas/v1/schedules/debit?$filter=contains(description,'{reservation_id}')"
+    return _find_schedules("debit", reservation_id)
+
+def get_debit_schedule_by_id(schedule_id):
+    url = f"https://api.nibo.com.br/empresas/v1/schedules/debit/{schedule_id}"
 
     headers = {
         "accept": "application/json",
@@ -60,13 +124,16 @@ def get_debit_schedule(reservation_id: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
+    if response.status_code == 404:
+        return False
+
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
         return False
 
-    return response["items"]
+    return response
 
 def update_debit_schedule(schedule_id, payload):
     url = f"https://api.nibo.com.br/empresas/v1/schedules/debit/{schedule_id}"
@@ -78,7 +145,7 @@ def update_debit_schedule(schedule_id, payload):
     }
 
     payload = sanitize_dates(payload)
-    response = requests.put(url, json=payload, headers=headers)
+    response = _nibo_request("PUT", url, headers, json=payload)
     if response.status_code == 204:
         return True
 
@@ -98,7 +165,7 @@ def delete_debit_schedule(schedule_id):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.delete(url, headers=headers)
+    response = _nibo_request("DELETE", url, headers)
     if response.status_code == 204:
         return True
 
@@ -119,7 +186,7 @@ def create_credit_schedule(payload):
     }
 
     payload = sanitize_dates(payload)
-    response = requests.post(url, json=payload, headers=headers)
+    response = _nibo_request("POST", url, headers, json=payload, retries=1)
     response = response.json()
 
     if "error" in response:
@@ -128,7 +195,10 @@ def create_credit_schedule(payload):
     return response
 
 def get_credit_schedule(reservation_id: str):
-    url = f"https://api.nibo.com.br/empresas/v1/schedules/credit?$filter=contains(description,'{reservation_id}')"
+    return _find_schedules("credit", reservation_id)
+
+def get_credit_schedule_by_id(schedule_id):
+    url = f"https://api.nibo.com.br/empresas/v1/schedules/credit/{schedule_id}"
 
     headers = {
         "accept": "application/json",
@@ -136,13 +206,16 @@ def get_credit_schedule(reservation_id: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
+    if response.status_code == 404:
+        return False
+
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
         return False
 
-    return response["items"]
+    return response
 
 def update_credit_schedule(schedule_id, payload):
     url = f"https://api.nibo.com.br/empresas/v1/schedules/credit/{schedule_id}"
@@ -154,7 +227,7 @@ def update_credit_schedule(schedule_id, payload):
     }
 
     payload = sanitize_dates(payload)
-    response = requests.put(url, json=payload, headers=headers)
+    response = _nibo_request("PUT", url, headers, json=payload)
     if response.status_code == 204:
         return True
 
@@ -174,7 +247,7 @@ def delete_credit_schedule(schedule_id):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.delete(url, headers=headers)
+    response = _nibo_request("DELETE", url, headers)
     if response.status_code == 204:
         return True
 
@@ -185,6 +258,7 @@ def delete_credit_schedule(schedule_id):
 
     return response
 
+@single_flight(inflight)
 def get_stakeholder(name: str):
     url = f"https://api.nibo.com.br/empresas/v1/customers?$filter=contains(name,'{name}')"
 
@@ -194,7 +268,7 @@ def get_stakeholder(name: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
@@ -202,6 +276,57 @@ def get_stakeholder(name: str):
 
     return response["items"][0] if len(response["items"]) > 0 else False
 
+def find_stakeholders_by_name(name: str):
+    """Customers named exactly `name`.
+
+    Falls back to the contains(name) search, filtered client-side, if Nibo
+    rejects the exact filter.
+    """
+    url = "https://api.nibo.com.br/empresas/v1/customers"
+
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "apitoken": NIBO_CLIENT_SECRET
+    }
+
+    response = _nibo_request("GET", url, headers, params={"$filter": f"name eq {odata_literal(name)}"}, hedge=True)
+    if response.ok:
+        response = response.json()
+        if "items" in response:
+            return response["items"]
+
+    logger.warning("Nibo exact customer lookup failed, falling back to name search")
+
+    response = _nibo_request("GET", url, headers, params={"$filter": f"contains(name,{odata_literal(name)})"}, hedge=True)
+    response = response.json()
+
+    if "statusCode" in response and response["statusCode"] == 404:
+        return []
+
+    return [customer for customer in response["items"] if customer.get("name") == name]
+
+def list_stakeholders(skip=0, page_size=500):
+    """One page of customers, oldest first."""
+    url = "https://api.nibo.com.br/empresas/v1/customers"
+
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "apitoken": NIBO_CLIENT_SECRET
+    }
+
+    params = {
+        "$orderby": "id",
+        "$top": page_size,
+        "$skip": skip,
+    }
+    response = _nibo_request("GET", url, headers, params=params)
+    response.raise_for_status()
+
+    return response.json().get("items", [])
+
+@single_flight(inflight)
 def get_stakeholder_by_id(stakeholder_id: str):
     url = f"https://api.nibo.com.br/empresas/v1/customers/{stakeholder_id}"
 
@@ -211,7 +336,7 @@ def get_stakeholder_by_id(stakeholder_id: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
@@ -232,10 +357,13 @@ def create_stakeholder(name: str):
         "name": name
     }
 
-    response = requests.post(url, json=payload, headers=headers)
+    response = _nibo_request("POST", url, headers, json=payload, retries=1)
+    # The body of a failed create is not an id; raising fails the event so it is retried
+    response.raise_for_status()
 
     return response.text.replace('"', '')
 
+@single_flight(inflight)
 def get_supplier(name: str):
     url = f"https://api.nibo.com.br/empresas/v1/suppliers?$filter=contains(name,'{name}')"
 
@@ -245,7 +373,7 @@ def get_supplier(name: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
@@ -253,6 +381,7 @@ def get_supplier(name: str):
 
     return response["items"][0] if len(response["items"]) > 0 else False
 
+@single_flight(inflight)
 def get_supplier_by_id(supplier_id: str):
     url = f"https://api.nibo.com.br/empresas/v1/suppliers/{supplier_id}"
 
@@ -262,7 +391,7 @@ def get_supplier_by_id(supplier_id: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
@@ -283,10 +412,12 @@ def create_supplier(name: str):
         "name": name
     }
 
-    response = requests.post(url, json=payload, headers=headers)
+    response = _nibo_request("POST", url, headers, json=payload, retries=1)
+    response.raise_for_status()
 
     return response.text.replace('"', '')
 
+@single_flight(inflight)
 def get_costcenter(description: str):
     url = f"https://api.nibo.com.br/empresas/v1/costcenters?$filter=contains(description,'{description}')"
 
@@ -296,7 +427,7 @@ def get_costcenter(description: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
@@ -304,6 +435,7 @@ def get_costcenter(description: str):
 
     return response["items"][0] if len(response["items"]) > 0 else False
 
+@single_flight(inflight)
 def get_costcenter_by_id(costcenters_id: str):
     url = f"https://api.nibo.com.br/empresas/v1/costcenters/{costcenters_id}"
 
@@ -313,7 +445,7 @@ def get_costcenter_by_id(costcenters_id: str):
         "apitoken": NIBO_CLIENT_SECRET
     }
 
-    response = requests.get(url, headers=headers)
+    response = _nibo_request("GET", url, headers, hedge=True)
     response = response.json()
 
     if "statusCode" in response and response["statusCode"] == 404:
@@ -334,33 +466,38 @@ def create_costcenter(description: str):
         "Description": description
     }
 
-    response = requests.post(url, json=payload, headers=headers)
+    response = _nibo_request("POST", url, headers, json=payload, retries=1)
+    response.raise_for_status()
 
     return response.text.replace('"', '')
 
+# The create endpoints answer with the new id, so the get-or-create helpers
+# below never read the record back. The creates raise on an error status
+# instead: their callers map the returned id for good.
+
+@single_flight(inflight)
 def find_stakeholder_id(name: str):
     stakeholder = get_stakeholder(name)
 
     if stakeholder is False:
-        stakeholder_id = create_stakeholder(name)
-        stakeholder = get_stakeholder_by_id(stakeholder_id)
+        return create_stakeholder(name)
 
     return stakeholder["id"]
 
+@single_flight(inflight)
 def find_supplier_id(name: str):
     supplier = get_supplier(name)
 
     if supplier is False:
-        supplier_id = create_supplier(name)
-        supplier = get_supplier_by_id(supplier_id)
+        return create_supplier(name)
 
     return supplier["id"]
 
+@single_flight(inflight)
 def find_costcenter_id(description):
     costcenters = get_costcenter(description)
 
     if costcenters is False:
-        costcenters_id = create_costcenter(description)
-        costcenters = get_costcenter_by_id(costcenters_id)
+        return create_costcenter(description)
 
     return costcenters["costCenterId"]
\ No newline at end of file
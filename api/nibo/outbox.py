@@ -0,0 +1,200 @@
+import json
+import logging
+import time
+from datetime import datetime
+
+from .index import create_credit_schedule, create_debit_schedule, get_credit_schedule, get_debit_schedule
+from .schedule_map import SCHEDULE_KINDS, schedule_id_from_response, record_schedule
+from ..breaker import CircuitOpenError
+from ..upstream import any_breaker_rejecting
+from ..db import reservation_lock
+
+logger = logging.getLogger(__name__)
+
+# The schedules of a reservation are written to the outbox in one DB
+# transaction before any of them is sent to Nibo, so a worker dying halfway
+# leaves pending rows to resume instead of a half-created reservation.
+#
+# A row is claimed (attempts + 1, committed) before its create is sent. A
+# row found with attempts > 0 may have reached Nibo before the worker died,
+# so it is first looked up by reference and adopted if it exists.
+
+MAX_ATTEMPTS = 5
+DISPATCH_TIME_BUDGET = 40  # seconds - leaves room under Vercel's maxDuration
+
+# Nibo schedule type -> (create, search by reservation)
+OUTBOX_CLIENTS = {
+    "credit": (create_credit_schedule, get_credit_schedule),
+    "debit": (create_debit_schedule, get_debit_schedule),
+}
+
+
+def enqueue_schedules(session, reservation_id, payloads, hashes):
+    """Write the payload of each new schedule ({kind: payload}) in one transaction.
+
+    Returns False if nothing could be written.
+    """
+    from ..models import NiboOutbox
+
+    now = datetime.now().isoformat()
+
+    try:
+        for kind, payload in payloads.items():
+            session.add(NiboOutbox(
+                reservation_id=str(reservation_id),
+                kind=kind,
+                payload=json.dumps(payload, ensure_ascii=False),
+                content_hash=hashes.get(kind, ""),
+                created_at=now,
+                updated_at=now,
+            ))
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to write outbox for {reservation_id}: {e}")
+        return False
+
+
+def _pending_rows(session, reservation_id=None, limit=None):
+    from sqlmodel import select
+    from ..models import NiboOutbox
+
+    query = select(NiboOutbox).where(NiboOutbox.status == "pending")
+    if reservation_id is not None:
+        query = query.where(NiboOutbox.reservation_id == str(reservation_id))
+    query = query.order_by(NiboOutbox.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return session.exec(query).all()
+
+
+def _save(session, row, **changes):
+    for field, value in changes.items():
+        setattr(row, field, value)
+    row.updated_at = datetime.now().isoformat()
+    session.add(row)
+    session.commit()
+
+
+def _find_existing(row):
+    schedule_type, suffix = SCHEDULE_KINDS[row.kind]
+    _, search = OUTBOX_CLIENTS[schedule_type]
+    reference = f"{row.reservation_id}{suffix}"
+
+    for schedule in search(row.reservation_id) or []:
+        if str(schedule.get("reference", "")) == reference and "scheduleId" in schedule:
+            return schedule
+    return None
+
+
+def _dispatch_row(session, row):
+    """Create the schedule of an outbox row in Nibo. Returns True once done."""
+    schedule_type, _ = SCHEDULE_KINDS[row.kind]
+    create, _ = OUTBOX_CLIENTS[schedule_type]
+
+    if row.attempts > 0:
+        try:
+            existing = _find_existing(row)
+        except Exception as e:
+            logger.warning(f"Could not look up outbox row {row.id} in Nibo: {e}")
+            return False
+
+        if existing is not None:
+            schedule_id = str(existing["scheduleId"])
+            record_schedule(session, row.reservation_id, row.kind, schedule_id, row.content_hash)
+            _save(session, row, status="done", schedule_id=schedule_id)
+            return True
+
+    _save(session, row, attempts=row.attempts + 1)
+
+    try:
+        transaction = create(json.loads(row.payload))
+        error = "Nibo rejected the schedule" if transaction is False else None
+    except CircuitOpenError as e:
+        # Nothing was sent: the attempt doesn't count
+        _save(session, row, attempts=row.attempts - 1, last_error=str(e))
+        return False
+    except Exception as e:
+        transaction = False
+        error = str(e)
+
+    if transaction is False:
+        status = "failed" if row.attempts >= MAX_ATTEMPTS else "pending"
+        _save(session, row, status=status, last_error=error)
+        return False
+
+    schedule_id = schedule_id_from_response(transaction)
+    record_schedule(session, row.reservation_id, row.kind, schedule_id, row.content_hash)
+    _save(session, row, status="done", schedule_id=schedule_id, last_error=None)
+    return True
+
+
+def dispatch_reservation_outbox(session, reservation_id):
+    """Apply the pending outbox rows of one reservation. Returns {kind: done}.
+
+    Callers hold the reservation lock.
+    """
+    results = {}
+    for row in _pending_rows(session, reservation_id):
+        results[row.kind] = _dispatch_row(session, row)
+    return results
+
+
+def cancel_reservation_outbox(session, reservation_id):
+    """Cancel the pending rows of a deleted reservation.
+
+    Returns how many of them may already have reached Nibo (attempts > 0).
+    """
+    if not session:
+        return 0
+
+    in_flight = 0
+    try:
+        for row in _pending_rows(session, reservation_id):
+            if row.attempts > 0:
+                in_flight += 1
+            _save(session, row, status="canceled")
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to cancel outbox of {reservation_id}: {e}")
+    return in_flight
+
+
+def dispatch_outbox(session, limit=50):
+    """Cron dispatcher: apply pending rows across reservations, oldest first.
+
+    Stops early if a circuit breaker opens or the time budget runs out, and
+    skips reservations another worker is processing.
+    """
+    summary = {"done": 0, "retrying": 0, "failed": 0, "skipped": 0, "stopped": None}
+    deadline = time.monotonic() + DISPATCH_TIME_BUDGET
+
+    reservation_ids = []
+    for row in _pending_rows(session, limit=limit):
+        if row.reservation_id not in reservation_ids:
+            reservation_ids.append(row.reservation_id)
+
+    for reservation_id in reservation_ids:
+        if any_breaker_rejecting():
+            summary["stopped"] = "circuit_open"
+            break
+        if time.monotonic() >= deadline:
+            summary["stopped"] = "time_budget"
+            break
+
+        with reservation_lock(reservation_id, timeout=0) as locked:
+            if not locked:
+                summary["skipped"] += 1
+                continue
+
+            for row in _pending_rows(session, reservation_id):
+                if _dispatch_row(session, row):
+                    summary["done"] += 1
+                elif row.status == "failed":
+                    summary["failed"] += 1
+                else:
+                    summary["retrying"] += 1
+
+    return summary
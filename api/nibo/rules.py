@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from ..money import from_cents
+from .utils import get_next_month_15
+from .constants import CATEGORIES_IDS
+
+DATE_FORMAT = "%Y-%m-%d"
+
+DATE_FIELDS = {
+    "check_in": "check_in_date",
+    "check_out": "check_out_date",
+}
+
+def compile_due_date_rule(rule):
+    """Turn a due date rule into a function of the reservation DTO.
+
+    Rules are tuples:
+      - ("days_after", "check_in" | "check_out", days)
+      - ("next_month_15", "check_in" | "check_out")
+    """
+    name, anchor, *args = rule
+    field = DATE_FIELDS[anchor]
+
+    if name == "days_after":
+        delta = timedelta(days=args[0])
+        return lambda reservation_dto: datetime.strptime(getattr(reservation_dto, field), DATE_FORMAT) + delta
+
+    if name == "next_month_15":
+        return lambda reservation_dto: get_next_month_15(datetime.strptime(getattr(reservation_dto, field), DATE_FORMAT))
+
+    raise ValueError(f"Unknown due date rule: {name}")
+
+def compile_rules(table):
+    """Compile a channel rule table into a partner -> variants dispatch dict.
+
+    The table maps a partner name (or a tuple of aliases) to a list of
+    variants, each a dict with:
+      - "when": optional predicate on the DTO; the first matching variant wins
+      - "due_date": a due date rule (see compile_due_date_rule)
+      - "categories": list of (category, dto field, condition) where the
+        category is emitted when the money field (centavos) is > 0 and the
+        optional condition holds
+    """
+    dispatch = {}
+
+    for partners, variants in table.items():
+        compiled = tuple(
+            (
+                variant.get("when"),
+                compile_due_date_rule(variant["due_date"]),
+                tuple(
+                    (CATEGORIES_IDS[category], field, condition)
+                    for category, field, condition in variant["categories"]
+                ),
+            )
+            for variant in variants
+        )
+
+        for partner in partners if isinstance(partners, tuple) else (partners,):
+            dispatch[partner] = compiled
+
+    return dispatch
+
+def apply_rules(dispatch, reservation_dto, transaction_dto):
+    """Fill categories, dueDate and scheduleDate from the partner's rules.
+
+    Partners without rules get no categories and keep their dates.
+    """
+    transaction_dto["categories"] = []
+
+    variants = dispatch.get(reservation_dto.partner_name)
+    if variants is None:
+        return transaction_dto
+
+    for when, due_date, categories in variants:
+        if when is None or when(reservation_dto):
+            break
+    else:
+        return transaction_dto
+
+    date = due_date(reservation_dto)
+    transaction_dto["dueDate"] = date
+    transaction_dto["scheduleDate"] = date
+    transaction_dto["categories"] = [
+        {"categoryId": category_id, "value": from_cents(getattr(reservation_dto, field))}
+        for category_id, field, condition in categories
+        if getattr(reservation_dto, field) > 0 and (condition is None or condition(reservation_dto))
+    ]
+
+    return transaction_dto
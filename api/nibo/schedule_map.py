@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from .index import get_debit_schedule, get_credit_schedule
+
+logger = logging.getLogger(__name__)
+
+# Every function taking a session is a no-op without one, and imports the
+# DB layer only once it has one (see api.db), keeping it off the cold start.
+
+# Schedule kind -> Nibo schedule type and reference suffix
+SCHEDULE_KINDS = {
+    "receivable": ("credit", ""),
+    "operational": ("debit", "_operacional"),
+    "comission": ("debit", "_comissao"),
+}
+
+
+def content_hash(categories):
+    """Stable hash of the categories we manage on a schedule."""
+    encoded = json.dumps(categories, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def kind_for_reference(reservation_id, reference):
+    reference = str(reference)
+    for kind, (_, suffix) in SCHEDULE_KINDS.items():
+        if reference == f"{reservation_id}{suffix}":
+            return kind
+    return None
+
+def schedule_id_from_response(response):
+    """Nibo answers a create with the new id, either bare or inside an object."""
+    if isinstance(response, str):
+        return response.replace('"', '') or None
+    if isinstance(response, dict):
+        return response.get("scheduleId") or response.get("id")
+    return None
+
+def get_mapped_schedules(session, reservation_id):
+    """Return {kind: ScheduleMap} for a reservation, or {} if unknown/unavailable."""
+    if not session:
+        return {}
+
+    from sqlmodel import select
+    from ..models import ScheduleMap
+
+    try:
+        rows = session.exec(select(ScheduleMap).where(ScheduleMap.reservation_id == str(reservation_id))).all()
+        return {row.kind: row for row in rows}
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to read schedule map for {reservation_id}: {e}")
+        return {}
+
+def record_schedule(session, reservation_id, kind, schedule_id, categories_hash=""):
+    """Insert or update the mapping of a reservation schedule. Never raises."""
+    if not session or not schedule_id:
+        return False
+
+    from sqlmodel import select
+    from ..models import ScheduleMap
+
+    try:
+        reservation_id = str(reservation_id)
+        row = session.exec(
+            select(ScheduleMap).where(ScheduleMap.reservation_id == reservation_id, ScheduleMap.kind == kind)
+        ).first()
+
+        if row is None:
+            row = ScheduleMap(reservation_id=reservation_id, kind=kind)
+
+        row.reference = f"{reservation_id}{SCHEDULE_KINDS[kind][1]}"
+        row.schedule_id = str(schedule_id)
+        row.content_hash = categories_hash or ""
+        row.updated_at = datetime.now().isoformat()
+
+        session.add(row)
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to record schedule {schedule_id} for {reservation_id}: {e}")
+        return False
+
+def forget_schedules(session, reservation_id, kinds=None):
+    """Drop the mapping rows of a reservation (all kinds by default). Never raises."""
+    if not session:
+        return False
+
+    try:
+        rows = get_mapped_schedules(session, reservation_id)
+        for kind, row in rows.items():
+            if kinds is None or kind in kinds:
+                session.delete(row)
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to forget schedules for {reservation_id}: {e}")
+        return False
+
+def sync_schedule_map(session, reservation_id, schedules):
+    """Point the mapping at the schedules Nibo actually has for a reservation.
+
+    `schedules` are Nibo schedule items (debit and credit mixed). For each
+    reference the smallest scheduleId wins, matching the dedupe survivor.
+    Returns a summary of the changes made.
+    """
+    summary = {"added": 0, "repointed": 0, "removed": 0}
+    if not session:
+        return summary
+
+    found = {}
+    for schedule in schedules or []:
+        kind = kind_for_reference(reservation_id, schedule.get("reference", ""))
+        if kind is None or "scheduleId" not in schedule:
+            continue
+        found.setdefault(kind, []).append(str(schedule["scheduleId"]))
+
+    mapped = get_mapped_schedules(session, reservation_id)
+
+    for kind, row in mapped.items():
+        if kind not in found:
+            forget_schedules(session, reservation_id, kinds=[kind])
+            summary["removed"] += 1
+
+    for kind, schedule_ids in found.items():
+        survivor = sorted(schedule_ids)[0]
+        row = mapped.get(kind)
+        if row is None:
+            record_schedule(session, reservation_id, kind, survivor)
+            summary["added"] += 1
+        elif row.schedule_id not in schedule_ids:
+            record_schedule(session, reservation_id, kind, survivor)
+            summary["repointed"] += 1
+
+    return summary
+
+def _load_schedules(reservation_id):
+    return (get_debit_schedule(reservation_id) or []) + (get_credit_schedule(reservation_id) or [])
+
+def reconcile_schedule_map(session, limit=100, load_schedules=_load_schedules):
+    """Verify the least recently touched mappings against Nibo.
+
+    Meant to run periodically: mappings whose schedules were deleted or
+    replaced in Nibo are repointed or dropped so that update/delete keep
+    addressing the right schedules. `load_schedules(reservation_id)` returns
+    the schedules Nibo has for a reservation.
+    """
+    from sqlmodel import select
+    from ..models import ScheduleMap
+
+    totals = {"reservations": 0, "added": 0, "repointed": 0, "removed": 0, "errors": 0}
+
+    rows = session.exec(select(ScheduleMap).order_by(ScheduleMap.updated_at).limit(limit)).all()
+    reservation_ids = list(dict.fromkeys(row.reservation_id for row in rows))
+
+    for reservation_id in reservation_ids:
+        try:
+            schedules = load_schedules(reservation_id)
+            summary = sync_schedule_map(session, reservation_id, schedules)
+
+            # Touch verified rows so the next run moves on to older ones
+            for row in get_mapped_schedules(session, reservation_id).values():
+                row.updated_at = datetime.now().isoformat()
+                session.add(row)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Failed to reconcile schedule map for {reservation_id}: {e}")
+            totals["errors"] += 1
+            continue
+
+        totals["reservations"] += 1
+        for key, value in summary.items():
+            totals[key] += value
+
+    return totals
@@ -0,0 +1,141 @@
+import logging
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+from .index import inflight, find_stakeholders_by_name, create_stakeholder, list_stakeholders
+from ..dryrun import dry_run_active
+
+logger = logging.getLogger(__name__)
+
+# Guests are resolved to Nibo customers through a local index keyed by the
+# normalized name (accents, case and whitespace folded), so "José  Silva"
+# and "jose silva" are the same customer. A miss is looked up in Nibo by
+# exact name, never by substring, and only then created; the create
+# response already carries the new id, so nothing is read back.
+#
+# The index lives in memory per instance and in the stakeholder_index table.
+# build_stakeholder_index.py loads every existing customer into it.
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _WHITESPACE.sub(" ", stripped).strip().casefold()
+
+
+def indexed_stakeholder_id(session, key):
+    """The customer id indexed under a normalized name, or None."""
+    with _memory_lock:
+        stakeholder_id = _memory.get(key)
+    if stakeholder_id is not None or not session:
+        return stakeholder_id
+
+    from ..models import StakeholderIndex
+
+    try:
+        row = session.get(StakeholderIndex, key)
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to read stakeholder index: {e}")
+        return None
+
+    if row is None:
+        return None
+
+    with _memory_lock:
+        _memory[key] = row.stakeholder_id
+    return row.stakeholder_id
+
+
+def _index_row(session, key, name, stakeholder_id, replace=True):
+    from ..models import StakeholderIndex
+
+    row = session.get(StakeholderIndex, key)
+    if row is not None and not replace:
+        return False
+
+    row = row or StakeholderIndex(normalized_name=key)
+    row.stakeholder_id = str(stakeholder_id)
+    row.name = name
+    row.updated_at = datetime.now().isoformat()
+    session.add(row)
+    return True
+
+
+def index_stakeholder(session, name, stakeholder_id):
+    """Index a customer under its normalized name. Never raises."""
+    # Dry-run ids are fake: caching them would hide the next run's create
+    if not stakeholder_id or dry_run_active():
+        return False
+
+    key = normalize_name(name)
+    with _memory_lock:
+        _memory[key] = str(stakeholder_id)
+
+    if not session:
+        return False
+
+    try:
+        _index_row(session, key, name, stakeholder_id)
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to index stakeholder {stakeholder_id}: {e}")
+        return False
+
+
+def _resolve(session, name, key):
+    stakeholder_id = indexed_stakeholder_id(session, key)
+    if stakeholder_id is not None:
+        return stakeholder_id
+
+    # Only ids Nibo confirmed get here: a failed search or create raises
+    found = find_stakeholders_by_name(name)
+    if found:
+        stakeholder_id = str(sorted(found, key=lambda customer: str(customer["id"]))[0]["id"])
+    else:
+        stakeholder_id = create_stakeholder(name)
+
+    index_stakeholder(session, name, stakeholder_id)
+    return stakeholder_id
+
+
+def resolve_stakeholder_id(session, name):
+    """Nibo customer id of a guest, created if no customer has that name."""
+    key = normalize_name(name)
+    # Concurrent runs for the same new guest share one create
+    return inflight.do(("resolve_stakeholder_id", key), _resolve, session, name, key)
+
+
+def build_stakeholder_index(session, page_size=500):
+    """Load every Nibo customer into the index. Returns counts.
+
+    When several customers share a normalized name the one already indexed
+    (or else the first listed) wins, so existing resolutions don't move.
+    """
+    summary = {"customers": 0, "indexed": 0, "duplicates": 0}
+    skip = 0
+
+    while True:
+        customers = list_stakeholders(skip=skip, page_size=page_size)
+        for customer in customers:
+            if not customer.get("id") or not customer.get("name"):
+                continue
+            if _index_row(session, normalize_name(customer["name"]), customer["name"], customer["id"], replace=False):
+                summary["indexed"] += 1
+            else:
+                summary["duplicates"] += 1
+        session.commit()
+
+        summary["customers"] += len(customers)
+        if len(customers) < page_size:
+            return summary
+        skip += page_size
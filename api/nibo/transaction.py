@@ -1,31 +1,41 @@
-from .index import create_credit_schedule, create_debit_schedule, get_credit_schedule, get_debit_schedule, update_credit_schedule, update_debit_schedule, delete_credit_schedule, delete_debit_schedule
+from .index import create_credit_schedule, create_debit_schedule, get_credit_schedule, get_debit_schedule, get_credit_schedule_by_id, get_debit_schedule_by_id, update_credit_schedule, update_debit_schedule, delete_credit_schedule, delete_debit_schedule
 from .receivables import get_receivable_data
 from .operational import get_operational_data
 from .comission import get_comission_data
+from ..money import to_cents, from_cents
 from .constants import CATEGORIES_IDS
+from .utils import belongs_to_reservation
+from .outbox import enqueue_schedules
+from .schedule_map import SCHEDULE_KINDS, content_hash, schedule_id_from_response, get_mapped_schedules, record_schedule, forget_schedules, sync_schedule_map, reconcile_schedule_map
+
+# Nibo schedule type -> (get by id, update, delete)
+SCHEDULE_CLIENTS = {
+    "debit": (get_debit_schedule_by_id, update_debit_schedule, delete_debit_schedule),
+    "credit": (get_credit_schedule_by_id, update_credit_schedule, delete_credit_schedule),
+}
 
 def format_description(reservation_dto):
-    reservation_id = reservation_dto["reservation_id"]
-    listing_internal_name = reservation_dto["listing_internal_name"]
-    partner_name = reservation_dto["partner_name"]
+    reservation_id = reservation_dto.reservation_id
+    listing_internal_name = reservation_dto.listing_internal_name
+    partner_name = reservation_dto.partner_name
 
     return f"Reserva #{reservation_id} - {listing_internal_name} - {partner_name}"
 
 def change_categories_value(reservation_dto, schedule_dto):
     transaction_dto = {
-        "stakeholderId": reservation_dto["stakeholder_id"],
+        "stakeholderId": reservation_dto.stakeholder_id,
         "description": format_description(reservation_dto),
-        "reference": reservation_dto["reservation_id"],
+        "reference": reservation_dto.reservation_id,
         "dueDate": "",
         "scheduleDate": "",
         "costCenterValueType": "1",
         "costCenters": [
             {
-                "costCenterId": reservation_dto["cost_center_id"],
+                "costCenterId": reservation_dto.cost_center_id,
                 "percent": 100
             }
         ],
-        "accrualDate": reservation_dto["check_in_date"],
+        "accrualDate": reservation_dto.check_in_date,
         "categories": []
     }
 
@@ -41,99 +51,154 @@ def change_categories_value(reservation_dto, schedule_dto):
     return transaction_dto["categories"]
 
 def get_center_cost(schedule_dto):
+    """Sum of the category values, added in centavos so it is exact to the cent."""
     center_cost = 0
 
     for category in schedule_dto["categories"]:
-        center_cost = center_cost + category["value"]
+        center_cost = center_cost + to_cents(category["value"])
+
+    return from_cents(center_cost)
 
-    return center_cost
+# Schedule kind -> (payload builder, create)
+TRANSACTION_BUILDERS = {
+    "receivable": (get_receivable_data, create_credit_schedule),
+    "operational": (get_operational_data, create_debit_schedule),
+    "comission": (get_comission_data, create_debit_schedule),
+}
 
-def send_transaction(reservation_dto, type: str):
+def build_transaction(reservation_dto, type: str):
     transaction_dto = {
-        "stakeholderId": reservation_dto["stakeholder_id"],
+        "stakeholderId": reservation_dto.stakeholder_id,
         "description": format_description(reservation_dto),
-        "reference": reservation_dto["reservation_id"],
+        "reference": reservation_dto.reservation_id,
         "dueDate": "",
         "scheduleDate": "",
         "costCenterValueType": "1",
         "costCenters": [
             {
-                "costCenterId": reservation_dto["cost_center_id"],
+                "costCenterId": reservation_dto.cost_center_id,
                 "percent": 100
             }
         ],
-        "accrualDate": reservation_dto["check_in_date"],
+        "accrualDate": reservation_dto.check_in_date,
         "categories": []
     }
 
-    if type == "operational":
-        transaction_dto = get_operational_data(reservation_dto, transaction_dto)
-        return create_debit_schedule(transaction_dto)
-    
-    elif type == "receivable":
-        transaction_dto = get_receivable_data(reservation_dto, transaction_dto)
+    if type not in TRANSACTION_BUILDERS:
+        return transaction_dto
+
+    get_data, _ = TRANSACTION_BUILDERS[type]
+    return get_data(reservation_dto, transaction_dto)
+
+def send_transaction(reservation_dto, type: str, session=None):
+    transaction_dto = build_transaction(reservation_dto, type)
+
+    if type not in TRANSACTION_BUILDERS:
         return create_credit_schedule(transaction_dto)
 
-    elif type == "comission":
-        transaction_dto = get_comission_data(reservation_dto, transaction_dto)
-        return create_debit_schedule(transaction_dto)
+    _, create_schedule = TRANSACTION_BUILDERS[type]
+    transaction = create_schedule(transaction_dto)
+
+    if transaction is not False:
+        schedule_id = schedule_id_from_response(transaction)
+        record_schedule(session, reservation_dto.reservation_id, type, schedule_id, content_hash(transaction_dto["categories"]))
 
-    return create_credit_schedule(transaction_dto)
+    return transaction
 
-def check_transaction_created(reservation_dto):
-    debit_schedules = get_debit_schedule(reservation_dto["reservation_id"])
-    credit_schedules = get_credit_schedule(reservation_dto["reservation_id"])
+def queue_transactions(reservation_dto, types, session):
+    """Compute the new schedules of a reservation and write them all to the
+    outbox in one DB transaction. Returns False if they could not be queued."""
+    payloads = {type: build_transaction(reservation_dto, type) for type in types}
+    hashes = {type: content_hash(payload["categories"]) for type, payload in payloads.items()}
+
+    return enqueue_schedules(session, reservation_dto.reservation_id, payloads, hashes)
+
+def check_transaction_created(reservation_dto, session=None):
+    if get_mapped_schedules(session, reservation_dto.reservation_id):
+        return True
+
+    debit_schedules = get_debit_schedule(reservation_dto.reservation_id)
+    credit_schedules = get_credit_schedule(reservation_dto.reservation_id)
 
     if len(debit_schedules) > 0 or len(credit_schedules) > 0:
         return True
     
     return False
 
-def update_transaction(reservation_report, reservation_dto):
+def apply_schedule_update(reservation_dto, schedule, schedule_type):
+    schedule["categories"] = change_categories_value(reservation_dto, schedule)
+    schedule["stakeholderId"] = schedule["stakeholder"]["id"]
+
+    if len(schedule["costCenters"]) > 0:
+        schedule["costCenters"][0]["value"] = get_center_cost(schedule)
+
+    _, update_schedule, _ = SCHEDULE_CLIENTS[schedule_type]
+    return update_schedule(schedule["scheduleId"], schedule)
+
+def _update_mapped_transaction(reservation_dto, mapped, session):
+    """Update the schedules recorded in the schedule map, addressing them by id.
+
+    Schedules whose categories hash did not change are skipped entirely.
+    Returns None if a mapped schedule no longer exists in Nibo, so the caller
+    can fall back to searching.
+    """
+    reservation_id = reservation_dto.reservation_id
     track_log = []
-    debit_schedules = get_debit_schedule(reservation_dto["reservation_id"])
-    credit_schedules = get_credit_schedule(reservation_dto["reservation_id"])
+
+    for kind, row in mapped.items():
+        schedule_type = SCHEDULE_KINDS[kind][0]
+        categories = change_categories_value(reservation_dto, {"reference": row.reference})
+        categories_hash = content_hash(categories)
+
+        if categories_hash == row.content_hash:
+            track_log.append({"skip_unchanged_schedule": {"kind": kind, "scheduleId": row.schedule_id}})
+            continue
+
+        get_schedule_by_id, _, _ = SCHEDULE_CLIENTS[schedule_type]
+        schedule = get_schedule_by_id(row.schedule_id)
+        track_log.append({f"get_{schedule_type}_schedule_by_id": row.schedule_id, "found": schedule is not False})
+
+        if schedule is False:
+            return None, track_log
+
+        transaction = apply_schedule_update(reservation_dto, schedule, schedule_type)
+        track_log.append({f"update_{schedule_type}_schedule": transaction})
+
+        if transaction is not False:
+            record_schedule(session, reservation_id, kind, row.schedule_id, categories_hash)
+
+    return True, track_log
+
+def update_transaction(reservation_report, reservation_dto, session=None):
+    track_log = []
+    reservation_id = reservation_dto.reservation_id
+
+    mapped = get_mapped_schedules(session, reservation_id)
+    if mapped:
+        result, track_log = _update_mapped_transaction(reservation_dto, mapped, session)
+        if result is not None:
+            return result, track_log
+
+        track_log.append({"schedule_map": "stale, falling back to search"})
+        forget_schedules(session, reservation_id)
+
+    debit_schedules = get_debit_schedule(reservation_id)
+    credit_schedules = get_credit_schedule(reservation_id)
     track_log.append({"get_debit_schedule":debit_schedules})
     track_log.append({"get_credit_schedule":credit_schedules})
 
     for debit_schedule in debit_schedules:
-        debit_schedule["categories"] = change_categories_value(reservation_dto, debit_schedule)
-        debit_schedule["stakeholderId"] = debit_schedule["stakeholder"]["id"]
-        
-        if len(debit_schedule["costCenters"]) > 0:
-            debit_schedule["costCenters"][0]["value"] = get_center_cost(debit_schedule)
-        
-        transaction = update_debit_schedule(debit_schedule["scheduleId"], debit_schedule)
+        transaction = apply_schedule_update(reservation_dto, debit_schedule, "debit")
         track_log.append({"update_debit_schedule":transaction})
 
     for credit_schedule in credit_schedules:
-        credit_schedule["categories"] = change_categories_value(reservation_dto, credit_schedule)
-        credit_schedule["stakeholderId"] = credit_schedule["stakeholder"]["id"]
-        
-        if len(credit_schedule["costCenters"]) > 0:
-            credit_schedule["costCenters"][0]["value"] = get_center_cost(credit_schedule)
-
-        transaction = update_credit_schedule(credit_schedule["scheduleId"], credit_schedule)
+        transaction = apply_schedule_update(reservation_dto, credit_schedule, "credit")
         track_log.append({"update_credit_schedule":transaction})
 
-    return True, track_log
-
-def _belongs_to_reservation(schedule, reservation_id):
-    """True if this schedule belongs to the given reservation.
-
-    Each logical schedule has a distinct reference:
-      - receivable (credit):   "<reservation_id>"
-      - operational (debit):   "<reservation_id>_operacional"
-      - comission (debit):     "<reservation_id>_comissao"
-
-    Matching on the reference (exact, or with a "_" suffix) avoids the
-    substring false-positives that a contains(description) query can produce
-    (e.g. reservation "MK06J" must not match "XMK06J").
-    """
-    reference = str(schedule.get("reference", ""))
-    reservation_id = str(reservation_id)
-    return reference == reservation_id or reference.startswith(reservation_id + "_")
+    # Backfill the map so the next event addresses these schedules by id
+    sync_schedule_map(session, reservation_id, list(debit_schedules) + list(credit_schedules))
 
+    return True, track_log
 
 def _dedupe_by_reference(schedules, reservation_id, delete_fn, kind):
     """Delete duplicate schedules that share the same reference.
@@ -151,7 +216,7 @@ def _dedupe_by_reference(schedules, reservation_id, delete_fn, kind):
 
     groups = {}
     for schedule in schedules:
-        if not _belongs_to_reservation(schedule, reservation_id):
+        if not belongs_to_reservation(schedule, reservation_id):
             continue
         if "scheduleId" not in schedule:
             continue
@@ -185,14 +250,11 @@ def _dedupe_by_reference(schedules, reservation_id, delete_fn, kind):
     return track_log
 
 
-def deduplicate_reservation_schedules(reservation_dto):
-    """Remove duplicate debit/credit schedules for a reservation.
+def deduplicate_schedules(reservation_id):
+    """Delete duplicate debit/credit schedules of a reservation.
 
-    Idempotent reconciliation run at the end of every create/update so that no
-    matter how many times the same reservation event is delivered, exactly one
-    schedule per reference survives.
+    Returns the dedupe log and the schedules that survived.
     """
-    reservation_id = reservation_dto["reservation_id"]
     track_log = []
 
     debit_schedules = get_debit_schedule(reservation_id)
@@ -201,10 +263,54 @@ def deduplicate_reservation_schedules(reservation_dto):
     track_log.extend(_dedupe_by_reference(debit_schedules, reservation_id, delete_debit_schedule, "debit"))
     track_log.extend(_dedupe_by_reference(credit_schedules, reservation_id, delete_credit_schedule, "credit"))
 
+    deleted = {str(entry["dedupe_delete"]["deleted_scheduleId"]) for entry in track_log}
+    survivors = [
+        schedule for schedule in list(debit_schedules or []) + list(credit_schedules or [])
+        if str(schedule.get("scheduleId")) not in deleted
+    ]
+
+    return track_log, survivors
+
+
+def deduplicate_reservation_schedules(reservation_dto, session=None):
+    """Remove duplicate debit/credit schedules for a reservation.
+
+    Idempotent reconciliation, run after an event that could not take the
+    reservation lock, so that no matter how many times the same reservation
+    event is delivered, exactly one schedule per reference survives. The
+    schedule map is then pointed at the survivors.
+    """
+    reservation_id = reservation_dto.reservation_id
+
+    track_log, survivors = deduplicate_schedules(reservation_id)
+    sync_schedule_map(session, reservation_id, survivors)
+
     return track_log
 
 
-def delete_transaction(reservation_id: str):
+def reconcile_reservation_schedules(session, limit=100):
+    """Periodic reconciler: dedupe the schedules of the least recently
+    verified reservations and point the schedule map at the survivors."""
+    return reconcile_schedule_map(session, limit=limit, load_schedules=lambda reservation_id: deduplicate_schedules(reservation_id)[1])
+
+
+def delete_transaction(reservation_id: str, session=None, search_leftovers=False):
+    """Delete the schedules of a reservation.
+
+    Mapped schedules are deleted by id; `search_leftovers` also searches Nibo
+    afterwards, for schedules that may exist without being mapped (canceled
+    outbox writes that were already in flight).
+    """
+    mapped = get_mapped_schedules(session, reservation_id)
+    if mapped:
+        for kind, row in mapped.items():
+            _, _, delete_schedule = SCHEDULE_CLIENTS[SCHEDULE_KINDS[kind][0]]
+            transaction = delete_schedule(row.schedule_id)
+
+        forget_schedules(session, reservation_id)
+        if not search_leftovers:
+            return True
+
     debit_schedules = get_debit_schedule(reservation_id)
     credit_schedules = get_credit_schedule(reservation_id)
 
@@ -1,11 +1,11 @@
-from dateutil import relativedelta
 from datetime import date
 
 from .constants import SPECIAL_BOOKING_APARTMENTS
 
 def get_next_month_15(date):
-    new_date = date + relativedelta.relativedelta(months=1)
-    return new_date.strftime("%Y-%m-15")
+    if date.month == 12:
+        return f"{date.year + 1:04d}-01-15"
+    return f"{date.year:04d}-{date.month + 1:02d}-15"
 
 def check_special_booking(partner_name):
     return partner_name in SPECIAL_BOOKING_APARTMENTS
@@ -18,3 +18,20 @@ def sanitize_dates(transaction_dto):
         transaction_dto["dueDate"] = transaction_dto["dueDate"].strftime("%Y-%m-%d")
 
     return transaction_dto
+
+
+def belongs_to_reservation(schedule, reservation_id):
+    """True if this schedule belongs to the given reservation.
+
+    Each logical schedule has a distinct reference:
+      - receivable (credit):   "<reservation_id>"
+      - operational (debit):   "<reservation_id>_operacional"
+      - comission (debit):     "<reservation_id>_comissao"
+
+    Matching on the reference (exact, or with a "_" suffix) avoids the
+    substring false-positives that a contains(description) query can produce
+    (e.g. reservation "MK06J" must not match "XMK06J").
+    """
+    reference = str(schedule.get("reference", ""))
+    reservation_id = str(reservation_id)
+    return reference == reservation_id or reference.startswith(reservation_id + "_")
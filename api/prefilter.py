@@ -0,0 +1,74 @@
+"""Ignore rules evaluated from the Stays payload alone.
+
+Runs before any Stays or Nibo request, so events we would drop anyway (not
+booked, check-in too old, unsupported action) cost nothing upstream.
+"""
+
+from datetime import datetime, timedelta
+
+from .utils import RESERVATION_ACTIONS
+
+CHECKIN_WINDOW_DAYS = 30
+
+CREATE_ACTIONS = frozenset(["reservation.created", "reservation.modified"])
+DELETE_ACTIONS = frozenset(["reservation.deleted", "reservation.canceled"])
+
+# Per-instance counters, exposed by /api/health
+PREFILTER_STATS = {
+    "evaluated": 0,
+    "ignored_unsupported_action": 0,
+    "ignored_not_booked": 0,
+    "ignored_too_old": 0,
+    "upstream_calls_saved": 0,
+}
+
+
+def is_checkin_date_older_than_one_month(check_in_date_str):
+    """Check if the check-in date is older than 1 month from now.
+
+    Returns None when the date isn't a plain YYYY-MM-DD.
+    """
+    try:
+        check_in_date = datetime.strptime(check_in_date_str, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+    one_month_ago = datetime.now() - timedelta(days=CHECKIN_WINDOW_DAYS)
+    return check_in_date < one_month_ago
+
+
+def _ignore(reason, calls_saved=0):
+    PREFILTER_STATS[f"ignored_{reason}"] += 1
+    PREFILTER_STATS["upstream_calls_saved"] += calls_saved
+    return reason
+
+
+def prefilter_event(action, reservation):
+    """Return why the event can be ignored, or None if it must be processed.
+
+    Reasons are "unsupported_action", "not_booked" and "too_old". For deletions
+    the payload's checkInDate replaces the reservations-export fetch the delete
+    path used to make just to read it, which is counted as a saved call.
+    """
+    PREFILTER_STATS["evaluated"] += 1
+
+    if action not in RESERVATION_ACTIONS:
+        return _ignore("unsupported_action")
+
+    creating = action in CREATE_ACTIONS
+
+    if creating and reservation.get("type") != "booked":
+        return _ignore("not_booked")
+
+    too_old = is_checkin_date_older_than_one_month(reservation.get("checkInDate"))
+    if too_old is None:
+        # Missing or unreadable: the export-based checks decide
+        return None
+
+    if not creating:
+        PREFILTER_STATS["upstream_calls_saved"] += 1
+
+    if too_old:
+        # Creations would have downloaded the export before finding out
+        return _ignore("too_old", calls_saved=1 if creating else 0)
+
+    return None
@@ -0,0 +1,144 @@
+"""Sampling profiler for slow pipeline runs.
+
+A run is profiled when the request carries a valid x-profile-signature
+header (an HMAC-SHA256 of the raw body keyed with PROFILE_SECRET, in hex),
+or at random for a PROFILE_SAMPLE_RATE fraction of runs. While it runs a
+background thread samples its stack every SAMPLE_INTERVAL seconds.
+
+Profiles requested by header are always kept; sampled ones only when the run
+took PROFILE_SLOW_MS or more. They are stored in the profiles table, linked
+to the run's Logs row, as folded stacks ("frame;frame;frame count" lines)
+that speedscope, flamegraph.pl or inferno load as a flame graph
+(export_profile.py writes one to a file).
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from .constants import PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_SECRET
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005  # seconds
+MAX_STACK_DEPTH = 128
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+
+def _fold(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profile:
+    def __init__(self, trigger):
+        self.trigger = trigger  # "header" or "sampled"
+        self.elapsed_ms = None
+        self.stacks = Counter()
+
+    @property
+    def slow(self):
+        return self.elapsed_ms is not None and self.elapsed_ms >= PROFILE_SLOW_MS
+
+    def keep(self):
+        return self.trigger == "header" or self.slow
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def profile_requested(headers, body: bytes):
+    """Whether the request asks to be profiled with a valid signature."""
+    signature = headers.get("x-profile-signature")
+    if not PROFILE_SECRET or not signature:
+        return False
+
+    digest = hmac.new(PROFILE_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature.strip().lower(), digest)
+
+
+@contextmanager
+def profile_run(requested=False):
+    """Profile the block if requested or sampled. Yields the Profile, or None."""
+    if requested:
+        profile = Profile("header")
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profile = Profile("sampled")
+    else:
+        yield None
+        return
+
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield profile
+    finally:
+        profile.stacks = sampler.stop()
+        profile.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+
+
+def safe_store_profile(session, log_id, dt, action, profile):
+    """Store a profile worth keeping next to its Logs row. Never raises."""
+    if profile is None or not profile.keep():
+        return False
+
+    if not session:
+        logger.warning(f"Dropped {profile.trigger} profile of {action} ({profile.elapsed_ms} ms): no database")
+        return False
+
+    from .models import Profiles
+
+    try:
+        session.add(Profiles(
+            log_id=log_id,
+            dt=dt,
+            action=action,
+            trigger=profile.trigger,
+            elapsed_ms=profile.elapsed_ms,
+            samples=sum(profile.stacks.values()),
+            stacks=profile.folded(),
+            created_at=datetime.now().isoformat(),
+        ))
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Failed to store profile of {action}: {e}")
+        return False
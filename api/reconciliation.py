@@ -0,0 +1,344 @@
+"""Stays <-> Nibo reconciliation.
+
+Loads the Stays export and every Nibo debit/credit schedule accrued in a
+date window in bulk, computes the schedules each booked reservation should
+have with the batch engine (api.batch), and joins both sides by reference in
+memory. The diff lists:
+
+  - missing: expected schedules Nibo doesn't have
+  - extra: schedules of a known reservation that shouldn't exist (canceled
+    reservations, or a commission that no longer applies)
+  - duplicate: several schedules with the same reference
+  - mismatch: category values differing from what we would send today
+
+apply_diff fixes them, one reservation at a time under its lock, with
+bounded concurrency. Deleting extras is opt-in.
+
+Both sides are loaded in RECONCILE_PAGE_DAYS pages, each one complete on
+its own (the Stays reports, their payloads and the Nibo schedules of those
+dates). The nightly cron (scheduled_reconcile) runs under a time budget: it
+stops starting pages once RECONCILE_TIME_BUDGET is spent, diffs the part of
+the window it loaded, and the next run starts from there.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from .batch import compute_batch
+from .db import get_db_session, safe_close_session, reservation_lock
+from .money import to_cents, from_cents
+from .nibo.index import list_schedules, get_credit_schedule, get_debit_schedule, delete_credit_schedule, delete_debit_schedule
+from .nibo.schedule_map import SCHEDULE_KINDS, kind_for_reference
+from .nibo.transaction import send_transaction, apply_schedule_update, deduplicate_schedules
+from .prefilter import CHECKIN_WINDOW_DAYS
+from .stays.index import export_reservations_window, get_reservation
+from .sync import date_pages, get_state, set_state
+from .utils import create_reservation_dto, calculate_expedia
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_FUTURE_DAYS = 60
+FETCH_CONCURRENCY = 8
+APPLY_CONCURRENCY = 4
+RECONCILE_PAGE_DAYS = 7
+RECONCILE_TIME_BUDGET = 40  # seconds - leaves room under Vercel's maxDuration for the page in flight
+
+CURSOR_KEY = "reconcile_nibo_cursor"
+
+DELETE_CLIENTS = {"debit": delete_debit_schedule, "credit": delete_credit_schedule}
+
+
+def default_window(today=None):
+    today = today or date.today()
+    return (today - timedelta(days=CHECKIN_WINDOW_DAYS)).isoformat(), (today + timedelta(days=RECONCILE_FUTURE_DAYS)).isoformat()
+
+
+def load_stays_reports(from_date, to_date):
+    return [report for report in export_reservations_window(from_date, to_date) if report.get("id")]
+
+
+def load_nibo_schedules(from_date, to_date):
+    """{reference: [(schedule type, schedule)]} of the window's schedules."""
+    index = {}
+    for schedule_type in ("credit", "debit"):
+        seen = set()
+        for schedule in list_schedules(schedule_type, from_date, to_date):
+            reference = str(schedule.get("reference") or "")
+            if not reference or "scheduleId" not in schedule or schedule["scheduleId"] in seen:
+                continue
+            seen.add(schedule["scheduleId"])
+            index.setdefault(reference, []).append((schedule_type, schedule))
+    return index
+
+
+def _needs_payload(report):
+    # total_paid, only available on the reservation itself, is only read by
+    # the booking.com rules; other partners are computed from the export alone.
+    return report.get("partnerName") == "API booking.com"
+
+
+def _load_payloads(reports):
+    targets = [report for report in reports if _needs_payload(report)]
+    with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as pool:
+        payloads = pool.map(lambda report: get_reservation(report["_id"]), targets)
+        return {str(report["id"]): payload for report, payload in zip(targets, payloads)}
+
+
+def load_window(from_date, to_date, deadline=None):
+    """Load both sides of the window page by page.
+
+    Returns (reports, payloads, nibo_index, last date loaded). Past the
+    deadline no further page is started (the first always is), so the last
+    date loaded may fall short of to_date.
+    """
+    reports, payloads, nibo_index = [], {}, {}
+    loaded_to = None
+    for page_from, page_to in date_pages(date.fromisoformat(from_date), date.fromisoformat(to_date), RECONCILE_PAGE_DAYS):
+        if loaded_to is not None and deadline is not None and time.monotonic() >= deadline:
+            break
+
+        page_reports = load_stays_reports(page_from, page_to)
+        reports.extend(page_reports)
+        payloads.update(_load_payloads(page_reports))
+        for reference, schedules in load_nibo_schedules(page_from, page_to).items():
+            nibo_index.setdefault(reference, []).extend(schedules)
+
+        loaded_to = page_to
+    return reports, payloads, nibo_index, loaded_to
+
+
+def _base_reservation_id(reference):
+    for _, suffix in SCHEDULE_KINDS.values():
+        if suffix and reference.endswith(suffix):
+            return reference[: -len(suffix)]
+    return reference
+
+
+def _schedule_values(schedule):
+    values = {}
+    for category in schedule.get("categories") or []:
+        category_id = category.get("categoryId")
+        values[category_id] = values.get(category_id, 0) + abs(to_cents(category.get("value") or 0))
+    return {category_id: value for category_id, value in values.items() if value}
+
+
+def _in_reais(values):
+    return {category_id: from_cents(value) for category_id, value in values.items()}
+
+
+def build_expected(reports, payloads):
+    """Expected schedules by reference, plus the DTO inputs and build errors."""
+    booked = []
+    errors = []
+
+    for report in reports:
+        if report.get("type", "booked") != "booked":
+            continue
+
+        report = dict(report)
+        report.setdefault("partnerName", "website")
+        reservation = payloads.get(str(report["id"]), {"stats": {"_f_totalPaid": 0}})
+
+        try:
+            booked.append((report, create_reservation_dto(report, reservation, resolve_ids=False)))
+        except Exception as e:
+            errors.append({"reservation_id": report["id"], "error": str(e)})
+
+    batch, computed = compute_batch([dto for _, dto in booked])
+    expected = {}
+
+    for index, (report, dto) in enumerate(booked):
+        for kind, (_, suffix) in SCHEDULE_KINDS.items():
+            if kind == "comission" and not (dto.partner_name == "API booking.com" and dto.total_paid == 0):
+                continue
+
+            categories = computed[kind]["categories"]
+            expected[f"{dto.reservation_id}{suffix}"] = {
+                "kind": kind,
+                "reservation_id": str(dto.reservation_id),
+                "values": {category_id: values[index] for category_id, values in categories.items() if values[index]},
+                "report": report,
+            }
+
+    return expected, errors
+
+
+def diff(expected, nibo_index, known_reservation_ids):
+    result = {"missing": [], "extra": [], "duplicate": [], "mismatch": []}
+
+    for reference, wanted in expected.items():
+        found = nibo_index.get(reference, [])
+        if not found:
+            result["missing"].append({"reference": reference, "reservation_id": wanted["reservation_id"], "kind": wanted["kind"]})
+            continue
+
+        found = sorted(found, key=lambda item: str(item[1]["scheduleId"]))
+        if len(found) > 1:
+            result["duplicate"].append({
+                "reference": reference,
+                "reservation_id": wanted["reservation_id"],
+                "scheduleIds": [schedule["scheduleId"] for _, schedule in found],
+            })
+
+        # Compared on the survivor the dedupe keeps
+        schedule_type, schedule = found[0]
+        actual = _schedule_values(schedule)
+        if actual != wanted["values"]:
+            result["mismatch"].append({
+                "reference": reference,
+                "reservation_id": wanted["reservation_id"],
+                "kind": wanted["kind"],
+                "scheduleId": schedule["scheduleId"],
+                "expected": _in_reais(wanted["values"]),
+                "actual": _in_reais(actual),
+            })
+
+    for reference, found in nibo_index.items():
+        reservation_id = _base_reservation_id(reference)
+        if reference in expected or reservation_id not in known_reservation_ids:
+            continue
+        if kind_for_reference(reservation_id, reference) is None:
+            continue
+        for schedule_type, schedule in found:
+            result["extra"].append({
+                "reference": reference,
+                "reservation_id": reservation_id,
+                "type": schedule_type,
+                "scheduleId": schedule["scheduleId"],
+            })
+
+    return result
+
+
+def reconcile(from_date=None, to_date=None, time_budget=None):
+    """Build the diff report of a window. Returns (report, context for apply_diff).
+
+    With a time_budget the window is cut at the last page loaded in time;
+    the report's "window" is what was diffed and "resume_from" the first
+    date left out (None when the whole window was covered).
+    """
+    if from_date is None or to_date is None:
+        from_date, to_date = default_window()
+
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    reports, payloads, nibo_index, loaded_to = load_window(from_date, to_date, deadline)
+    resume_from = None
+    if loaded_to is not None and loaded_to < to_date:
+        resume_from = (date.fromisoformat(loaded_to) + timedelta(days=1)).isoformat()
+        to_date = loaded_to
+
+    expected, errors = build_expected(reports, payloads)
+
+    result = diff(expected, nibo_index, {str(report["id"]) for report in reports})
+    report = {
+        "window": [from_date, to_date],
+        "resume_from": resume_from,
+        "summary": {
+            "stopped": "time_budget" if resume_from else None,
+            "reservations": len(reports),
+            "expected_schedules": len(expected),
+            "nibo_references": len(nibo_index),
+            **{key: len(items) for key, items in result.items()},
+            "errors": len(errors),
+        },
+        **result,
+        "errors": errors,
+    }
+
+    context = {"expected": expected, "nibo_index": nibo_index, "payloads": payloads}
+    return report, context
+
+
+def scheduled_reconcile(session):
+    """The cron's run: the default window, from where the last run stopped. Returns the report.
+
+    Without a session every run starts at the beginning of the window.
+    """
+    from_date, to_date = default_window()
+    resume_from = get_state(session, CURSOR_KEY) if session else ""
+    if from_date < resume_from <= to_date:
+        from_date = resume_from
+
+    report, _ = reconcile(from_date, to_date, time_budget=RECONCILE_TIME_BUDGET)
+    if session:
+        set_state(session, CURSOR_KEY, report["resume_from"] or "")
+    return report
+
+
+def _light_dto(wanted, context):
+    report = wanted["report"]
+    reservation = context["payloads"].get(wanted["reservation_id"], {"stats": {"_f_totalPaid": 0}})
+    return calculate_expedia(create_reservation_dto(report, reservation, resolve_ids=False))
+
+
+def _existing_references(reservation_id):
+    references = set()
+    for search in (get_credit_schedule, get_debit_schedule):
+        for schedule in search(reservation_id) or []:
+            if "scheduleId" in schedule:
+                references.add(str(schedule.get("reference") or ""))
+    return references
+
+
+def _fix_reservation(reservation_id, actions, context, delete_extra):
+    log = []
+    session = get_db_session()
+
+    try:
+        with reservation_lock(reservation_id):
+            if actions["duplicate"]:
+                dedupe_log, _ = deduplicate_schedules(reservation_id)
+                log.append({"dedupe": dedupe_log})
+
+            for item in actions["mismatch"]:
+                wanted = context["expected"][item["reference"]]
+                schedule_type, schedule = sorted(context["nibo_index"][item["reference"]], key=lambda found: str(found[1]["scheduleId"]))[0]
+                log.append({"update": item["reference"], "result": apply_schedule_update(_light_dto(wanted, context), schedule, schedule_type)})
+
+            if actions["missing"]:
+                wanted = context["expected"][actions["missing"][0]["reference"]]
+                report = wanted["report"]
+                reservation = context["payloads"].get(reservation_id) or get_reservation(report["_id"])
+                dto = calculate_expedia(create_reservation_dto(report, reservation, session=session))
+
+                # The diff predates the lock: a webhook may have created them since
+                existing = _existing_references(reservation_id)
+                for item in actions["missing"]:
+                    if item["reference"] in existing:
+                        log.append({"create": item["reference"], "result": "already exists"})
+                        continue
+                    log.append({"create": item["reference"], "result": send_transaction(dto, item["kind"], session)})
+
+            if delete_extra:
+                for item in actions["extra"]:
+                    log.append({"delete": item["reference"], "result": DELETE_CLIENTS[item["type"]](item["scheduleId"])})
+    except Exception as e:
+        log.append({"error": str(e)})
+    finally:
+        safe_close_session(session)
+
+    return reservation_id, log
+
+
+def apply_diff(report, context, delete_extra=False):
+    """Fix the discrepancies of a diff report. Returns {reservation_id: log}."""
+    by_reservation = {}
+    for key in ("missing", "extra", "duplicate", "mismatch"):
+        for item in report[key]:
+            actions = by_reservation.setdefault(item["reservation_id"], {"missing": [], "extra": [], "duplicate": [], "mismatch": []})
+            actions[key].append(item)
+
+    if not delete_extra:
+        by_reservation = {
+            reservation_id: actions for reservation_id, actions in by_reservation.items()
+            if actions["missing"] or actions["duplicate"] or actions["mismatch"]
+        }
+
+    with ThreadPoolExecutor(max_workers=APPLY_CONCURRENCY) as pool:
+        results = pool.map(
+            lambda item: _fix_reservation(item[0], item[1], context, delete_extra),
+            by_reservation.items(),
+        )
+        return dict(results)
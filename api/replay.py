@@ -0,0 +1,305 @@
+"""Replay of logged webhook traffic, for load tests.
+
+Streams the webhook events stored in the requests table through the
+pipeline in time order, either as fast as possible or at N x their original
+pace, and measures each one: latency, outcome and upstream calls. Two modes:
+
+  - dry-run: reads go to the real Stays and Nibo, writes are recorded and
+    not sent (see api.dryrun);
+  - stand-ins: no network at all. StandIns answers Stays from the replayed
+    payloads and the mirrored export reports, and keeps an in-memory Nibo
+    that later events see, so modifications take the update path.
+
+Events run without a database session and take no reservation locks:
+nothing is logged, queued or mapped, and live webhooks are never held up.
+The payload-only ignore rules still apply relative to today, so old traffic
+is mostly ignored; replay recent windows.
+"""
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+from .db import skip_reservation_locks
+from .dryrun import dry_run
+from .upstream import count_upstream_calls, use_transport
+from .utils import RESERVATION_ACTIONS
+
+_EQ = re.compile(r"(\w+) eq '((?:[^']|'')*)'")
+_CONTAINS = re.compile(r"contains\((\w+),\s*'((?:[^']|'')*)'\)")
+
+# Nibo collection -> field holding the id of its records
+NIBO_ID_FIELDS = {
+    "schedules/credit": "scheduleId",
+    "schedules/debit": "scheduleId",
+    "customers": "id",
+    "suppliers": "id",
+    "costcenters": "costCenterId",
+}
+
+
+def load_events(session, from_dt=None, to_dt=None, limit=None):
+    """Webhook events of the requests table, oldest first."""
+    from sqlmodel import select
+    from .models import Requests
+
+    query = select(Requests).where(Requests.action.in_(list(RESERVATION_ACTIONS)))
+    if from_dt:
+        query = query.where(Requests.dt >= from_dt)
+    if to_dt:
+        query = query.where(Requests.dt <= to_dt)
+    query = query.order_by(Requests.dt, Requests.id)
+    if limit:
+        query = query.limit(limit)
+
+    return [
+        {"_dt": row.dt, "action": row.action, "payload": json.loads(row.payload)}
+        for row in session.exec(query.execution_options(yield_per=500))
+    ]
+
+
+def load_mirrored_reports(session, reservation_ids):
+    """Mirrored export reports of the replayed reservations, for the stand-ins."""
+    from sqlmodel import select
+    from .models import ReservationMirror
+
+    reports = []
+    reservation_ids = list(reservation_ids)
+    for start in range(0, len(reservation_ids), 500):
+        rows = session.exec(select(ReservationMirror).where(ReservationMirror.reservation_id.in_(reservation_ids[start:start + 500]))).all()
+        reports.extend(json.loads(row.report) for row in rows if row.report)
+    return reports
+
+
+class StandInResponse:
+    """The parts of requests.Response the clients use."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = json.dumps(body, ensure_ascii=False)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} from stand-in")
+
+    def iter_content(self, chunk_size=1):
+        encoded = self.text.encode("utf-8")
+        for start in range(0, len(encoded), chunk_size):
+            yield encoded[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _odata_conditions(url, params):
+    query = dict(parse_qsl(urlsplit(url).query))
+    query.update(params or {})
+    odata_filter = str(query.get("$filter", ""))
+
+    unquote = lambda value: value.replace("''", "'")
+    equals = [(field, unquote(value)) for field, value in _EQ.findall(odata_filter)]
+    contains = [(field, unquote(value)) for field, value in _CONTAINS.findall(odata_filter)]
+    return query, equals, contains
+
+
+def _field(record, field):
+    # Nibo takes "Description" on create and returns "description"
+    return str(record.get(field, record.get(field[:1].upper() + field[1:], "")))
+
+
+def _as_stored(record):
+    # Schedules are written with stakeholderId and read back with a stakeholder object
+    if "stakeholderId" in record:
+        record["stakeholder"] = {"id": record["stakeholderId"]}
+    return record
+
+
+class StandIns:
+    """Local Stays and Nibo for replays, with the signature of requests.request."""
+
+    def __init__(self, reports=(), latency_ms=0):
+        self.latency = latency_ms / 1000
+        self.reservations = {}
+        self.reports = {str(report["_id"]): report for report in reports if report.get("_id")}
+        self.nibo = {collection: {} for collection in NIBO_ID_FIELDS}
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def observe(self, reservation):
+        """Serve this payload for the reservation from now on, as Stays would."""
+        with self._lock:
+            for key in ("_id", "id"):
+                if reservation.get(key):
+                    self.reservations[str(reservation[key])] = reservation
+
+    def __call__(self, method, url, headers=None, json=None, params=None, timeout=None, stream=False):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            if "stays.com.br" in url:
+                return self._stays(method, urlsplit(url).path.split("/external/v1/", 1)[-1], json)
+            return self._nibo(method, url, json, params)
+
+    def _stays(self, method, path, payload):
+        if path == "booking/reservations-export":
+            listings = set(payload.get("listingId") or [])
+            reports = [
+                report for report in self.reports.values()
+                if payload["from"] <= report.get("checkInDate", "") <= payload["to"]
+                and (not listings or self._listing_of(report) in listings | {None})
+            ]
+            return StandInResponse(200, reports)
+
+        if path.startswith("booking/reservations/"):
+            reservation = self.reservations.get(path.rsplit("/", 1)[-1])
+            return StandInResponse(200, reservation) if reservation else StandInResponse(404, {"message": "not found"})
+
+        if path == "content/listings":
+            return StandInResponse(200, [])
+
+        # Single listings and clients: unknown, callers keep the report's names
+        return StandInResponse(404, {"message": "not found"})
+
+    def _listing_of(self, report):
+        return self.reservations.get(str(report["_id"]), {}).get("_idlisting")
+
+    def _nibo(self, method, url, payload, params):
+        path = urlsplit(url).path.split("/empresas/v1/", 1)[-1]
+        collection = next(name for name in NIBO_ID_FIELDS if path == name or path.startswith(name + "/"))
+        record_id = path[len(collection) + 1:]
+        records = self.nibo[collection]
+        id_field = NIBO_ID_FIELDS[collection]
+
+        if method == "POST":
+            self._ids += 1
+            record_id = f"stand-in-{self._ids}"
+            records[record_id] = _as_stored({**payload, id_field: record_id})
+            return StandInResponse(200, record_id)
+
+        if record_id:
+            if record_id not in records:
+                return StandInResponse(404, {"statusCode": 404})
+            if method == "PUT":
+                records[record_id] = _as_stored({**records[record_id], **payload, id_field: record_id})
+                return StandInResponse(204, None)
+            if method == "DELETE":
+                del records[record_id]
+                return StandInResponse(204, None)
+            return StandInResponse(200, records[record_id])
+
+        query, equals, contains = _odata_conditions(url, params)
+        items = [
+            record for record in records.values()
+            if (not equals or any(_field(record, field) == value for field, value in equals))
+            and all(value in _field(record, field) for field, value in contains)
+        ]
+        skip = int(query.get("$skip", 0))
+        top = int(query.get("$top", len(items)))
+        return StandInResponse(200, {"items": items[skip:skip + top], "count": len(items)})
+
+
+def _outcome(result, errors):
+    if isinstance(result, dict) and result.get("status") == "ignored":
+        return "ignored"
+    return "ok" if result is not False and not errors else "failed"
+
+
+def _run_event(event, handle_event, stand_ins):
+    if stand_ins is not None:
+        stand_ins.observe(event["payload"])
+
+    track_log = []
+    errors = []
+    started = time.perf_counter()
+
+    # Both modes leave the reservation locks of the real database alone
+    with count_upstream_calls() as calls, skip_reservation_locks(), (dry_run() if stand_ins is None else nullcontext([])) as writes:
+        try:
+            result = handle_event(event, track_log, errors, None)
+        except Exception as e:
+            errors.append(str(e))
+            result = False
+
+    return {
+        "dt": event["_dt"],
+        "action": event["action"],
+        "reservation_id": event["payload"].get("id"),
+        "outcome": _outcome(result, errors),
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "calls": calls,
+        "dry_run_writes": len(writes),
+        "errors": errors,
+    }
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+def summarize(results, wall_seconds):
+    latencies = [result["latency_ms"] for result in results]
+    calls = {}
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+        for key, count in result["calls"].items():
+            calls[key] = calls.get(key, 0) + count
+
+    events = len(results) or 1
+    return {
+        "events": len(results),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_per_second": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "outcomes": outcomes,
+        "latency_ms": {f"p{int(q * 100)}": _percentile(latencies, q) for q in (0.5, 0.9, 0.95, 0.99)} | {"max": _percentile(latencies, 1)},
+        "upstream_calls": calls,
+        "upstream_calls_per_event": {key: round(count / events, 2) for key, count in calls.items()},
+        "dry_run_writes_per_event": round(sum(result["dry_run_writes"] for result in results) / events, 2),
+    }
+
+
+def replay(events, handle_event, stand_ins=None, speed=0, workers=8):
+    """Run events through `handle_event(event, track_log, errors, session)`.
+
+    With `stand_ins` every upstream call goes to them, otherwise the events
+    run in dry-run mode. `speed` 0 sends them as fast as the workers allow;
+    N > 0 keeps their original spacing divided by N. Returns (summary,
+    per-event results).
+    """
+    started = time.monotonic()
+    first_dt = datetime.fromisoformat(events[0]["_dt"]) if events and speed else None
+
+    with use_transport(stand_ins) if stand_ins is not None else nullcontext(), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for event in events:
+            if first_dt is not None:
+                offset = (datetime.fromisoformat(event["_dt"]) - first_dt).total_seconds() / speed
+                delay = started + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(_run_event, event, handle_event, stand_ins))
+
+        results = [future.result() for future in futures]
+
+    return summarize(results, time.monotonic() - started), results
@@ -0,0 +1,65 @@
+"""Per-upstream retry budgets.
+
+Retries stack up across layers (our HTTP client, Stays redelivering the
+webhook, manual re-calls of the endpoints), so during a brownout every
+failure multiplies the load on the upstream. A budget only grants a retry
+while retries stay under a fraction of the recent successful calls, plus a
+small floor so an idle instance can still retry at all.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class RetryBudget:
+    def __init__(self, name, ratio=0.2, min_retries=5, window_seconds=60):
+        self.name = name
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_seconds = window_seconds
+
+        self._lock = threading.Lock()
+        self._successes = deque()
+        self._retries = deque()
+        self.granted = 0
+        self.denied = 0
+
+    def _trim(self, now):
+        for events in (self._successes, self._retries):
+            while events and now - events[0] > self.window_seconds:
+                events.popleft()
+
+    def _allowed(self):
+        return self.min_retries + int(len(self._successes) * self.ratio)
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            self._successes.append(now)
+            self._trim(now)
+
+    def try_retry(self):
+        """Take a retry from the budget. Returns False if it is exhausted."""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+
+            if len(self._retries) >= self._allowed():
+                self.denied += 1
+                return False
+
+            self._retries.append(now)
+            self.granted += 1
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "recent_successes": len(self._successes),
+                "recent_retries": len(self._retries),
+                "allowed": self._allowed(),
+                "granted": self.granted,
+                "denied": self.denied,
+            }
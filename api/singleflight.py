@@ -0,0 +1,65 @@
+"""Collapse concurrent identical upstream calls into a single in-flight call.
+
+When several workers ask for the same supplier, cost center or export at the
+same moment, only the first one calls the upstream; the others wait for it and
+share its result (or its exception). Every caller, the first one included,
+gets its own deep copy, so callers can keep mutating what they receive.
+"""
+
+import copy
+import functools
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "shared": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executed"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            # Copied before the followers are released to copy it too
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+def single_flight(group):
+    """Decorator keying calls on the function name and its (hashable) positional args."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            return group.do((fn.__name__,) + args, fn, *args)
+        return wrapper
+    return decorator
@@ -0,0 +1,136 @@
+"""Append-only disk spool for log rows the database could not take.
+
+While Postgres is unavailable, safe_log_request/safe_log append their rows
+here as NDJSON (one {"table", "row"} object per line) instead of dropping
+them. Segments rotate by size; replay_spool bulk-loads them back into the
+requests/logs tables and deletes each segment once it is committed. A
+segment the database rejects for anything but a lost connection is renamed
+to .bad and left for inspection, so it doesn't block the ones behind it.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from .constants import LOG_SPOOL_DIR
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAX_BYTES = 1024 * 1024
+SEGMENT_SUFFIX = ".ndjson"
+BAD_SUFFIX = ".bad"
+# Segments of other processes are only replayed once they stop growing
+SETTLE_SECONDS = 5
+
+_lock = threading.Lock()
+_segment = None
+_pending = None  # unknown until the spool directory is first checked
+
+
+def _new_segment():
+    return os.path.join(LOG_SPOOL_DIR, f"{time.time_ns()}-{os.getpid()}{SEGMENT_SUFFIX}")
+
+
+def spool_row(table, row):
+    """Append a row for `table` to the current segment. Never raises."""
+    global _segment, _pending
+
+    line = json.dumps({"table": table, "row": row}, ensure_ascii=False) + "\n"
+
+    with _lock:
+        try:
+            os.makedirs(LOG_SPOOL_DIR, exist_ok=True)
+
+            if _segment is None or (os.path.exists(_segment) and os.path.getsize(_segment) >= SEGMENT_MAX_BYTES):
+                _segment = _new_segment()
+
+            with open(_segment, "a", encoding="utf-8") as f:
+                f.write(line)
+
+            _pending = True
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to spool {table} row: {e}")
+            return False
+
+
+def _segments():
+    try:
+        names = os.listdir(LOG_SPOOL_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(LOG_SPOOL_DIR, name) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+
+def spool_pending():
+    global _pending
+
+    if _pending is None:
+        _pending = bool(_segments())
+    return _pending
+
+
+def _read_segment(path):
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                rows.append((entry["table"], entry["row"]))
+            except (ValueError, KeyError):
+                # A torn last line from a crashed writer
+                logger.warning(f"Skipping unreadable spool line in {path}")
+    return rows
+
+
+def replay_spool(session, max_rows=500):
+    """Bulk-load spooled rows back into the database, oldest segment first.
+
+    Each segment is inserted in one transaction and deleted once committed.
+    Stops after `max_rows` rows (whole segments only) and leaves the rest for
+    the next call. Connection errors are raised; a segment failing for any
+    other reason is set aside as .bad and the replay goes on.
+    """
+    global _segment, _pending
+
+    from .db import _is_connection_error
+    from .models import Requests, Logs
+
+    tables = {"requests": Requests, "logs": Logs}
+    totals = {"segments": 0, "rows": 0, "bad_segments": 0}
+
+    with _lock:
+        # New writes go to a fresh segment while the current ones are replayed
+        _segment = None
+        now = time.time()
+
+        for path in _segments():
+            if totals["rows"] >= max_rows:
+                break
+
+            own = path.endswith(f"-{os.getpid()}{SEGMENT_SUFFIX}")
+            if not own and now - os.path.getmtime(path) < SETTLE_SECONDS:
+                continue
+
+            rows = _read_segment(path)
+            try:
+                session.add_all([tables[table](**row) for table, row in rows if table in tables])
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                if _is_connection_error(e):
+                    raise
+                logger.error(f"Setting aside spool segment {path} the database rejected: {e}")
+                os.replace(path, path + BAD_SUFFIX)
+                totals["bad_segments"] += 1
+                continue
+
+            os.remove(path)
+            totals["segments"] += 1
+            totals["rows"] += len(rows)
+
+        _pending = bool(_segments())
+
+    return totals
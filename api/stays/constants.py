@@ -1,6 +1 @@
-from os import getenv
-from dotenv import load_dotenv
-
-load_dotenv()
-
-STAYS_SECRET = getenv("STAYS_SECRET")
\ No newline at end of file
+from ..constants import STAYS_SECRET
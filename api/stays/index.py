@@ -1,32 +1,15 @@
-import requests
-import time
 import logging
 
+from ..upstream import upstream_request, upstream_stream, MAX_RETRIES
+from ..jsonstream import iter_json_array
 from .constants import STAYS_SECRET
 
 logger = logging.getLogger(__name__)
 
-REQUEST_TIMEOUT = 8  # seconds - must be under Vercel's 10s limit
-MAX_RETRIES = 2
-
-
-def _request_with_retry(method, url, headers, json=None, retries=MAX_RETRIES):
-    """Make HTTP request with timeout and retry on transient failures"""
-    for attempt in range(retries):
-        try:
-            if method == "GET":
-                response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
-            elif method == "POST":
-                response = requests.post(url, json=json, headers=headers, timeout=REQUEST_TIMEOUT)
-            return response
-        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-            if attempt < retries - 1:
-                wait = 1 * (attempt + 1)
-                logger.warning(f"Stays API retry {attempt+1}/{retries} for {url}: {e}")
-                time.sleep(wait)
-            else:
-                logger.error(f"Stays API failed after {retries} attempts: {url}: {e}")
-                raise
+
+def _request_with_retry(method, url, headers, json=None, params=None, retries=MAX_RETRIES):
+    """Make HTTP request with timeout, circuit breaker and retry on transient failures"""
+    return upstream_request("stays", method, url, headers, json=json, params=params, retries=retries)
 
 
 def get_reservation(reservation_id: str):
@@ -42,7 +25,16 @@ def get_reservation(reservation_id: str):
 
     return response.json()
 
-def get_reservation_report(reservation):
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_export(from_date: str, to_date: str, listing_id: str | None = None):
+    """Stream the reports of the reservations arriving between the two dates.
+
+    Reports are parsed one by one from the response (see api.jsonstream), so
+    memory stays flat whatever the size of the export, and stopping the
+    iteration stops the download.
+    """
     url = "https://adsa.stays.com.br/external/v1/booking/reservations-export"
 
     headers = {
@@ -52,19 +44,49 @@ def get_reservation_report(reservation):
     }
 
     payload = {
-        "from": reservation["checkInDate"],
-        "to": reservation["checkOutDate"],
-        "dateType": "arrival",
-        "listingId": [reservation["_idlisting"]]
+        "from": from_date,
+        "to": to_date,
+        "dateType": "arrival"
     }
+    if listing_id is not None:
+        payload["listingId"] = [listing_id]
+
+    # The call is recorded (breaker, latency) once the download ends
+    chunks = upstream_stream("stays", "POST", url, headers, json=payload, chunk_size=EXPORT_CHUNK_SIZE)
+    try:
+        yield from iter_json_array(chunks)
+        # Read to the end of the body so the download counts as complete
+        for _ in chunks:
+            pass
+    finally:
+        chunks.close()
+
+def export_reservations(from_date: str, to_date: str, listing_id: str):
+    """Reports of one listing's reservations, streamed."""
+    return iter_export(from_date, to_date, listing_id)
+
+def export_reservations_window(from_date: str, to_date: str):
+    """Reports of every listing's reservations arriving between the two dates, streamed."""
+    return iter_export(from_date, to_date)
 
-    response = _request_with_retry("POST", url, headers, json=payload)
-    response = response.json()
+def get_reservation_report(reservation):
+    """Report of one reservation, picked from its listing's export.
+
+    Stops reading the export as soon as the reservation is found.
+    """
+    reports = export_reservations(reservation["checkInDate"], reservation["checkOutDate"], reservation["_idlisting"])
+
+    try:
+        return pick_report(reports, reservation["_id"])
+    finally:
+        reports.close()
 
-    for item in response:
-        if item["_id"] == reservation["_id"]:
+def pick_report(reports, reservation_id):
+    """The report of `reservation_id` (`_id`) in an export, or False."""
+    for item in reports:
+        if item["_id"] == reservation_id:
             return item
-    
+
     return False
 
 def get_listing(listing_id: str):
@@ -80,6 +102,20 @@ def get_listing(listing_id: str):
 
     return response.json()
 
+def list_listings(skip: int = 0, limit: int = 20):
+    """One page of the account's listings."""
+    url = "https://adsa.stays.com.br/external/v1/content/listings"
+
+    headers = {
+        "Authorization": f"Basic {STAYS_SECRET}",
+        "accept": "application/json",
+        "content-type": "application/json"
+    }
+
+    response = _request_with_retry("GET", url, headers, params={"skip": skip, "limit": limit})
+
+    return response.json()
+
 def get_client(client_id: str):
     url = f"https://adsa.stays.com.br/external/v1/booking/clients/{client_id}"
 
@@ -0,0 +1,190 @@
+"""Scheduled catch-up sync from the Stays reservations export.
+
+Covers webhook deliveries that never arrived. Each run pages the export of
+all listings over a rolling arrival window, in SYNC_PAGE_DAYS slices, and
+hashes every report; only reservations whose report changed since they were
+last synced go through the processing pipeline.
+
+The export can't be filtered by modification time, so the high-water mark
+is the last page of the current sweep that was fully processed: a run that
+hits its time budget resumes from the next page, and a new sweep starts
+once the whole window has been covered.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from .breaker import CircuitOpenError
+from .mirror import mirror_reports
+from .prefilter import CHECKIN_WINDOW_DAYS
+from .stays.index import export_reservations_window
+from .upstream import any_breaker_rejecting
+
+logger = logging.getLogger(__name__)
+
+SYNC_WINDOW_FUTURE_DAYS = 365
+SYNC_PAGE_DAYS = 31
+SYNC_TIME_BUDGET = 40  # seconds - leaves room under Vercel's maxDuration
+SYNC_MAX_CHANGES = 25  # reservations processed per run
+SYNC_MAX_ATTEMPTS = 3  # failed runs of the same report before it is skipped
+
+CURSOR_KEY = "export_sync_cursor"
+LAST_SWEEP_KEY = "export_sync_last_sweep"
+FAILURES_KEY = "export_sync_failures:{}"
+
+
+def report_hash(report):
+    encoded = json.dumps(report, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_state(session, key, default=""):
+    from .models import SyncState
+
+    row = session.get(SyncState, key)
+    return row.value if row is not None else default
+
+
+def set_state(session, key, value):
+    from .models import SyncState
+
+    row = session.get(SyncState, key) or SyncState(key=key)
+    row.value = value
+    row.updated_at = datetime.now().isoformat()
+    session.add(row)
+    session.commit()
+
+
+def _known_hashes(session, reservation_ids):
+    from sqlmodel import select
+    from .models import SyncedReservations
+
+    if not reservation_ids:
+        return {}
+
+    rows = session.exec(select(SyncedReservations).where(SyncedReservations.reservation_id.in_(reservation_ids))).all()
+    return {row.reservation_id: row.content_hash for row in rows}
+
+
+def _mark_synced(session, reservation_id, content_hash):
+    from .models import SyncedReservations
+
+    row = session.get(SyncedReservations, reservation_id) or SyncedReservations(reservation_id=reservation_id)
+    row.content_hash = content_hash
+    row.synced_at = datetime.now().isoformat()
+    session.add(row)
+    session.commit()
+
+
+def _record_failure(session, reservation_id, content_hash):
+    """Count a failed sync of this version of the report. Returns the attempts so far."""
+    key = FAILURES_KEY.format(reservation_id)
+    failed_hash, _, count = get_state(session, key).partition(" ")
+    attempts = int(count) + 1 if failed_hash == content_hash and count else 1
+    set_state(session, key, f"{content_hash} {attempts}")
+    return attempts
+
+
+def date_pages(start, end, page_days=SYNC_PAGE_DAYS):
+    """Split [start, end] into (from, to) ISO date pages of `page_days` days."""
+    pages = []
+    while start <= end:
+        page_end = min(start + timedelta(days=page_days - 1), end)
+        pages.append((start.isoformat(), page_end.isoformat()))
+        start = page_end + timedelta(days=1)
+    return pages
+
+
+def sync_pages(today=None):
+    """(from, to) arrival-date pages covering the rolling sync window."""
+    today = today or date.today()
+    return date_pages(today - timedelta(days=CHECKIN_WINDOW_DAYS), today + timedelta(days=SYNC_WINDOW_FUTURE_DAYS))
+
+
+def sync_from_export(session, process_report):
+    """Process the reservations whose export report changed since last synced.
+
+    `process_report(report, session)` runs one report through the pipeline and
+    returns True once it is handled; failed ones keep their old hash and are
+    picked up again by the next run. After SYNC_MAX_ATTEMPTS failures of the
+    same report it is marked synced anyway (the nightly reconciliation reports
+    it, reconcile_nibo.py --apply fixes it), so reports that always fail can't
+    hold the cursor on their page. Only processed reports count toward
+    SYNC_MAX_CHANGES.
+
+    The run stops while an upstream breaker is open, and a failure with the
+    breaker open doesn't count as an attempt: an outage must not use them up.
+    """
+    summary = {"pages": 0, "reports": 0, "changed": 0, "processed": 0, "failed": 0, "given_up": 0, "stopped": None}
+    deadline = time.monotonic() + SYNC_TIME_BUDGET
+
+    cursor = get_state(session, CURSOR_KEY)
+    pages = [page for page in sync_pages() if page[0] > cursor]
+
+    for from_date, to_date in pages:
+        if any_breaker_rejecting():
+            summary["stopped"] = "circuit_open"
+            break
+        if time.monotonic() >= deadline:
+            summary["stopped"] = "time_budget"
+            break
+
+        reports = [report for report in export_reservations_window(from_date, to_date) if report.get("id")]
+        mirror_reports(session, reports)
+        known = _known_hashes(session, [str(report["id"]) for report in reports])
+
+        summary["pages"] += 1
+        summary["reports"] += len(reports)
+
+        hashed = [(report, report_hash(report)) for report in reports]
+        changed = [(report, content_hash) for report, content_hash in hashed if known.get(str(report["id"])) != content_hash]
+        summary["changed"] += len(changed)
+
+        for report, content_hash in changed:
+            if any_breaker_rejecting():
+                summary["stopped"] = "circuit_open"
+                break
+            if summary["processed"] >= SYNC_MAX_CHANGES:
+                summary["stopped"] = "max_changes"
+                break
+            if time.monotonic() >= deadline:
+                summary["stopped"] = "time_budget"
+                break
+
+            circuit_open = False
+            try:
+                handled = process_report(report, session)
+            except CircuitOpenError as e:
+                logger.warning(f"Sync of reservation {report['id']} stopped: {e}")
+                handled, circuit_open = False, True
+            except Exception as e:
+                logger.warning(f"Sync of reservation {report['id']} failed: {e}")
+                handled = False
+
+            if handled:
+                _mark_synced(session, str(report["id"]), content_hash)
+                summary["processed"] += 1
+                continue
+
+            summary["failed"] += 1
+            if circuit_open or any_breaker_rejecting():
+                summary["stopped"] = "circuit_open"
+                break
+            if _record_failure(session, str(report["id"]), content_hash) >= SYNC_MAX_ATTEMPTS:
+                logger.warning(f"Giving up on syncing reservation {report['id']} after {SYNC_MAX_ATTEMPTS} failed attempts")
+                _mark_synced(session, str(report["id"]), content_hash)
+                summary["given_up"] += 1
+
+        if summary["stopped"]:
+            break
+
+        set_state(session, CURSOR_KEY, from_date)
+
+    if not summary["stopped"]:
+        set_state(session, CURSOR_KEY, "")
+        set_state(session, LAST_SWEEP_KEY, datetime.now().isoformat())
+
+    return summary
@@ -0,0 +1,226 @@
+"""HTTP client shared by the Stays and Nibo integrations.
+
+Every upstream call goes through upstream_request (or upstream_stream for
+bodies read incrementally), which applies the upstream's circuit breaker, an
+adaptive per-endpoint timeout (see api.latency), optional hedging of
+idempotent reads and retries on transient failures, limited by the
+upstream's retry budget.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+import requests
+
+from .breaker import CircuitBreaker, OPEN
+from .latency import tracker_for
+from .retry_budget import RetryBudget
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 2
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Runs hedged reads; the primary request also goes through it so the caller
+# can wait on whichever answers first.
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+UPSTREAM_LABELS = {
+    "stays": "Stays API",
+    "nibo": "Nibo API",
+}
+
+BREAKERS = {name: CircuitBreaker(name) for name in UPSTREAM_LABELS}
+RETRY_BUDGETS = {name: RetryBudget(name) for name in UPSTREAM_LABELS}
+
+# Replaces requests.request while set (see use_transport)
+_transport = None
+_call_counter = ContextVar("upstream_calls", default=None)
+
+
+@contextmanager
+def use_transport(transport):
+    """Send every upstream call of the process to `transport` for the block.
+
+    `transport` takes the arguments of requests.request. Meant for local
+    stand-ins in tools (see api.replay), never for the app.
+    """
+    global _transport
+
+    previous = _transport
+    _transport = transport
+    try:
+        yield
+    finally:
+        _transport = previous
+
+
+@contextmanager
+def count_upstream_calls():
+    """Count the upstream requests made in the block, by "<upstream> <method>"."""
+    calls = {}
+    token = _call_counter.set(calls)
+    try:
+        yield calls
+    finally:
+        _call_counter.reset(token)
+
+
+def breaker_states():
+    return {name: breaker.snapshot() for name, breaker in BREAKERS.items()}
+
+
+def retry_budget_states():
+    return {name: budget.snapshot() for name, budget in RETRY_BUDGETS.items()}
+
+
+def any_breaker_open():
+    return any(breaker.state != "closed" for breaker in BREAKERS.values())
+
+
+def any_breaker_rejecting():
+    """Whether some breaker is open and failing calls fast.
+
+    Unlike any_breaker_open, half-open doesn't count: crons keep going so
+    their next call can be the probe that closes the breaker.
+    """
+    return any(breaker.state == OPEN for breaker in BREAKERS.values())
+
+
+def _is_failure(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def _send(tracker, method, url, headers, json, params, timeout, stream=False):
+    started = time.monotonic()
+    try:
+        request = _transport or requests.request
+        return request(method, url, headers=headers, json=json, params=params, timeout=timeout, stream=stream)
+    finally:
+        # A stream's latency is the whole download, recorded by upstream_stream
+        if not stream:
+            tracker.record(time.monotonic() - started)
+
+
+def _send_hedged(tracker, method, url, headers, json, params, timeout, stream=False):
+    """Send a read; if it is slower than the endpoint's p95, race a second copy."""
+    delay = tracker.hedge_delay()
+    primary = _hedge_pool.submit(_send, tracker, method, url, headers, json, params, timeout, stream)
+
+    if delay is None:
+        return primary.result()
+
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeout:
+        pass
+
+    if not tracker.take_hedge():
+        return primary.result()
+
+    hedge = _hedge_pool.submit(_send, tracker, method, url, headers, json, params, timeout, stream)
+    done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+
+    for future in (primary, hedge):
+        if future in done and future.exception() is None:
+            if future is hedge:
+                tracker.record_hedge_win()
+            return future.result()
+
+    # The first one to finish failed: the other is the last chance
+    remaining = hedge if primary in done else primary
+    return remaining.result()
+
+
+def upstream_request(upstream, method, url, headers, json=None, params=None, retries=MAX_RETRIES, timeout=None, hedge=False, stream=False):
+    """Make HTTP request with timeout, circuit breaker and retry on transient failures.
+
+    Without an explicit `timeout` the endpoint's adaptive timeout is used.
+    With `stream` the body is left unread and a successful call is not
+    recorded yet: read it through upstream_stream, which records it once the
+    body is read.
+    `hedge` is only honoured for GETs, which are safe to send twice.
+    Raises CircuitOpenError without calling the upstream while its breaker is open.
+    """
+    breaker = BREAKERS[upstream]
+    budget = RETRY_BUDGETS[upstream]
+    label = UPSTREAM_LABELS[upstream]
+    tracker = tracker_for(upstream, method, url)
+    send = _send_hedged if hedge and method == "GET" else _send
+
+    calls = _call_counter.get()
+    key = f"{upstream} {method}"
+
+    for attempt in range(retries):
+        breaker.check()
+        tracker.start_call()
+        # Slow is judged against this endpoint's own latency, not a global
+        # threshold that naturally slow calls (exports) would always cross;
+        # the breaker's default applies until the endpoint has samples
+        call_timeout = timeout or tracker.timeout()
+        slow_after = tracker.slow_threshold(call_timeout)
+        started = time.monotonic()
+        if calls is not None:
+            calls[key] = calls.get(key, 0) + 1
+
+        try:
+            response = send(tracker, method, url, headers, json, params, call_timeout, stream)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            breaker.record(True, time.monotonic() - started, slow_after)
+            if attempt < retries - 1 and budget.try_retry():
+                wait_seconds = 1 * (attempt + 1)
+                logger.warning(f"{label} retry {attempt+1}/{retries} for {url}: {e}")
+                time.sleep(wait_seconds)
+                continue
+            logger.error(f"{label} failed after {attempt+1} attempts: {url}: {e}")
+            raise
+        except Exception:
+            breaker.record(True, time.monotonic() - started, slow_after)
+            raise
+
+        failed = _is_failure(response)
+        if not (stream and not failed):
+            breaker.record(failed, time.monotonic() - started, slow_after)
+        if not failed:
+            budget.record_success()
+        return response
+
+
+def upstream_stream(upstream, method, url, headers, json=None, params=None, retries=MAX_RETRIES, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the body of a request in chunks, recording the call once it is read.
+
+    The request itself (breaker check, retries until the headers arrive) goes
+    through upstream_request. The breaker and the endpoint's latency then see
+    the whole download, and an error while reading the body counts as a
+    failed call. A caller that stops reading early is neither a failure nor a
+    latency sample.
+    """
+    response = upstream_request(upstream, method, url, headers, json=json, params=params, retries=retries, stream=True)
+    if _is_failure(response):
+        # Already recorded by upstream_request
+        with response:
+            yield from response.iter_content(chunk_size=chunk_size)
+        return
+
+    breaker = BREAKERS[upstream]
+    tracker = tracker_for(upstream, method, url)
+    elapsed = getattr(response, "elapsed", None)
+    started = time.monotonic() - (elapsed.total_seconds() if elapsed else 0)
+    slow_after = tracker.slow_threshold(tracker.timeout())
+
+    failed, complete = True, True
+    try:
+        with response:
+            yield from response.iter_content(chunk_size=chunk_size)
+        failed = False
+    except GeneratorExit:
+        failed, complete = False, False
+        raise
+    finally:
+        duration = time.monotonic() - started
+        if complete:
+            tracker.record(duration)
+        breaker.record(failed, duration, slow_after)
@@ -1,34 +1,15 @@
-import json
+import base64
+import hashlib
+import hmac
+import re
 
-from sqlmodel import Field, SQLModel
 from api.nibo.constants import NIBO_ACCOUNT_ID
-from api.nibo.index import find_costcenter_id, find_stakeholder_id
-from .constants import STAYS_CLIENT_LOGIN
-
-class Requests(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
-    dt: str = Field(default=None)
-    action: str = Field(default=None)
-    payload: str = Field(default=None)
-
-    def create(self, session):
-        session.add(self)
-        session.commit()
-        session.refresh(self)
-        return self
-    
-class Logs(SQLModel, table=True):
-    id: int | None = Field(default=None, primary_key=True)
-    dt: str = Field(default=None)
-    action: str = Field(default=None)
-    payload: str = Field(default=None)
-    internal_payload: str = Field(default=None)
-
-    def create(self, session):
-        session.add(self)
-        session.commit()
-        session.refresh(self)
-        return self
+from api.nibo.entity_map import resolve_entity_id
+from api.nibo.stakeholders import resolve_stakeholder_id
+from .catalog import catalog_name
+from .constants import STAYS_CLIENT_LOGIN, STAYS_CLIENT_SECRET, STAYS_WEBHOOK_MAX_BYTES, STAYS_WEBHOOK_VERIFY_SIGNATURE, CRON_SECRET
+from .dto import ReservationDTO
+from .money import EXPEDIA_CLEANING_FEE, EXPEDIA_ISS_RATE, EXPEDIA_COMPANY_COMISSION_RATE, to_cents, mul_ratio
 
 def validate_header(headers):
     if "x-stays-client-id" not in headers or "x-stays-signature" not in headers:
@@ -41,20 +22,85 @@ def validate_header(headers):
 
     return True
 
-def create_request_log(dt,action,payload,session):
-    Requests(
-        dt=dt,
-        action=action,
-        payload=json.dumps(payload, ensure_ascii=False)
-    ).create(session=session)
-
-def create_log(dt,action,payload,internal_payload,session):
-    Logs(
-         dt=dt,
-        action=action,
-        payload=json.dumps(payload, ensure_ascii=False),
-        internal_payload=json.dumps(internal_payload, ensure_ascii=False)
-    ).create(session=session)
+# Webhook actions we act on; anything else is acknowledged and dropped
+RESERVATION_ACTIONS = frozenset([
+    "reservation.created",
+    "reservation.modified",
+    "reservation.deleted",
+    "reservation.canceled",
+])
+
+# Only invalidate the cached listing (see api.catalog)
+LISTING_ACTIONS = frozenset([
+    "listing.created",
+    "listing.modified",
+    "listing.deleted",
+])
+
+WEBHOOK_ACTIONS = RESERVATION_ACTIONS | LISTING_ACTIONS
+
+_ACTION_PATTERN = re.compile(rb'"action"\s*:\s*"([^"\\]{1,64})"')
+
+def webhook_body_too_large(size):
+    try:
+        return int(size) > STAYS_WEBHOOK_MAX_BYTES
+    except (TypeError, ValueError):
+        return False
+
+def verify_signature(body: bytes, signature: str):
+    """Check x-stays-signature as an HMAC-SHA256 of the raw body keyed with
+    STAYS_CLIENT_SECRET, accepting hex or base64 (optionally "sha256=")."""
+    if not STAYS_WEBHOOK_VERIFY_SIGNATURE:
+        return True
+
+    if not STAYS_CLIENT_SECRET or not signature:
+        return False
+
+    signature = signature.strip()
+    if signature.lower().startswith("sha256="):
+        signature = signature[len("sha256="):]
+
+    digest = hmac.new(STAYS_CLIENT_SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+
+    return (
+        hmac.compare_digest(signature.lower(), digest.hex())
+        or hmac.compare_digest(signature, base64.b64encode(digest).decode("ascii"))
+    )
+
+def screen_webhook(headers, body: bytes):
+    """Cheap checks on the raw webhook request, before any parsing or I/O.
+
+    Returns (status, action): status is None when the event should be
+    processed, 413/403 when it must be rejected, or 200 when it is
+    authentic but carries an action we don't handle. A body with more than
+    one "action" key (e.g. nested in the payload) isn't classified here: the
+    caller checks the parsed top-level action.
+    """
+    if webhook_body_too_large(len(body)):
+        return 413, None
+
+    if not validate_header(headers):
+        return 403, None
+
+    if not verify_signature(body, headers.get("x-stays-signature")):
+        return 403, None
+
+    matches = _ACTION_PATTERN.findall(body)
+    if len(matches) > 1:
+        return None, None
+    action = matches[0].decode("utf-8") if matches else None
+
+    if action not in WEBHOOK_ACTIONS:
+        return 200, action
+
+    return None, action
+
+def validate_cron_header(headers):
+    """Vercel Cron calls the job endpoints with "Authorization: Bearer <CRON_SECRET>"."""
+    if not CRON_SECRET:
+        return False
+
+    return headers.get("authorization") == f"Bearer {CRON_SECRET}"
 
 # Canonical partner names expected by the channel routing (receivables /
 # operational / comission). Stays may return the same partner with different
@@ -75,7 +121,16 @@ def normalize_partner_name(name):
         return name
     return _CANONICAL_PARTNERS.get(name.strip().lower(), name)
 
-def create_reservation_dto(reservation_report, reservation):
+def create_reservation_dto(reservation_report, reservation, resolve_ids=True, session=None):
+    """Build the ReservationDTO of a reservation.
+
+    The listing and owner names are read from the Stays catalog by id (see
+    api.catalog), falling back to the names in the report.
+
+    `resolve_ids=False` skips the catalog and the Nibo cost center and
+    stakeholder lookups (the ids are left empty), for bulk jobs that only
+    need the values.
+    """
     try:
 
         # Initialize variables
@@ -109,11 +164,22 @@ def create_reservation_dto(reservation_report, reservation):
         except Exception as e:
             raise Exception(f"Error processing owner fee: {str(e)}")
 
-        # Get listing internal name
+        # Get listing and owner, by their stable Stays ids
         try:
+            listing_id = str(reservation.get("_idlisting") or reservation_report["listing"].get("_id") or "")
             listing_internal_name = reservation_report["listing"]["internalName"]
         except Exception as e:
             raise Exception(f"Error getting listing internal name: {str(e)}")
+
+        try:
+            owner_id = str(reservation_report["client"].get("_id") or reservation.get("_idclient") or "")
+            owner_name = reservation_report["client"]["name"]
+        except Exception as e:
+            raise Exception(f"Error getting owner name: {str(e)}")
+
+        if resolve_ids:
+            listing_internal_name = catalog_name(session, "listing", listing_id) or listing_internal_name
+            owner_name = catalog_name(session, "client", owner_id) or owner_name
         
         # Get guest name
         try:
@@ -135,20 +201,25 @@ def create_reservation_dto(reservation_report, reservation):
         except Exception as e:
             raise Exception(f"Error getting reservation ID: {str(e)}")
 
-        try:
-            cost_center_id = find_costcenter_id(listing_internal_name)
-        except Exception as e:
-            raise Exception(f"Error finding cost center ID: {str(e)}")
+        cost_center_id = ""
+        stakeholder_id = ""
+        supplier_id = ""
 
-        try:
-            stakeholder_id = find_stakeholder_id(guest_name)
-        except Exception as e:
-            raise Exception(f"Error finding stakeholder ID: {str(e)}")
+        if resolve_ids:
+            try:
+                cost_center_id = resolve_entity_id(session, "costcenter", listing_id, listing_internal_name)
+            except Exception as e:
+                raise Exception(f"Error finding cost center ID: {str(e)}")
 
-        try:
-            owner_name = reservation_report["client"]["name"]
-        except Exception as e:
-            raise Exception(f"Error getting owner name: {str(e)}")
+            try:
+                supplier_id = resolve_entity_id(session, "supplier", owner_id, owner_name)
+            except Exception as e:
+                raise Exception(f"Error finding owner supplier ID: {str(e)}")
+
+            try:
+                stakeholder_id = resolve_stakeholder_id(session, guest_name)
+            except Exception as e:
+                raise Exception(f"Error finding stakeholder ID: {str(e)}")
 
         try:
             check_in_date = reservation_report["checkInDate"]
@@ -180,28 +251,31 @@ def create_reservation_dto(reservation_report, reservation):
 
         # Build the final DTO
         try:
-            dto = {
-                "account_id": NIBO_ACCOUNT_ID,
-                "reservation_id": reservation_id,
-                "cost_center_id": cost_center_id,
-                "stakeholder_id": stakeholder_id,
-                "guest_name": guest_name,
-                "owner_name": owner_name,
-                "check_in_date": check_in_date,
-                "check_out_date": check_out_date,
-                "partner_name": partner_name,
-                "listing_internal_name": listing_internal_name,
-                "cleaning_fee": cleaning_fee,
-                "electricity_fee": electricity_fee,
-                "company_comission": company_comission,
-                "buy_price": buy_price,
-                "reserve_total": reserve_total,
-                "total_paid": total_paid,
-                "service_charge": service_charge,
-                "creation_date": creation_date,
-                "iss": iss,
-                "owner_fee": owner_fee,
-            }
+            dto = ReservationDTO(
+                account_id=NIBO_ACCOUNT_ID,
+                reservation_id=reservation_id,
+                cost_center_id=cost_center_id,
+                stakeholder_id=stakeholder_id,
+                guest_name=guest_name,
+                owner_name=owner_name,
+                check_in_date=check_in_date,
+                check_out_date=check_out_date,
+                partner_name=partner_name,
+                listing_internal_name=listing_internal_name,
+                creation_date=creation_date,
+                listing_id=listing_id,
+                owner_id=owner_id,
+                supplier_id=supplier_id,
+                cleaning_fee=to_cents(cleaning_fee),
+                electricity_fee=to_cents(electricity_fee),
+                company_comission=to_cents(company_comission),
+                buy_price=to_cents(buy_price),
+                reserve_total=to_cents(reserve_total),
+                total_paid=to_cents(total_paid),
+                service_charge=to_cents(service_charge),
+                iss=to_cents(iss),
+                owner_fee=to_cents(owner_fee),
+            )
             return dto
         except Exception as e:
             raise Exception(f"Error building final DTO: {str(e)}")
@@ -210,14 +284,19 @@ def create_reservation_dto(reservation_report, reservation):
         raise e
 
 def calculate_expedia(reservation_dto):
-    if reservation_dto["partner_name"] == "API expedia":
-        reservation_dto["cleaning_fee"] = 190
-        balance = reservation_dto["reserve_total"] - reservation_dto["cleaning_fee"]
+    """Split an Expedia reserve total into ISS, company comission and buy price.
+
+    Computed in integer centavos (see api.money) so the values are exact to
+    the cent and identical to the batch path in api.batch.
+    """
+    if reservation_dto.partner_name == "API expedia":
+        reservation_dto.cleaning_fee = to_cents(EXPEDIA_CLEANING_FEE)
+        balance = reservation_dto.reserve_total - reservation_dto.cleaning_fee
 
-        reservation_dto["iss"] = balance * 0.04762
-        balance = balance - reservation_dto["iss"]
+        reservation_dto.iss = mul_ratio(balance, *EXPEDIA_ISS_RATE)
+        balance = balance - reservation_dto.iss
 
-        reservation_dto["company_comission"] = balance * 0.25
-        reservation_dto["buy_price"] = balance - reservation_dto["company_comission"]
+        reservation_dto.company_comission = mul_ratio(balance, *EXPEDIA_COMPANY_COMISSION_RATE)
+        reservation_dto.buy_price = balance - reservation_dto.company_comission
 
     return reservation_dto
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Stakeholder Index Build Script
+
+Loads every Nibo customer into the stakeholder_index table, keyed by its
+normalized name (accents, case and whitespace folded), so guests are
+resolved locally instead of searching Nibo. New guests are indexed as they
+are resolved; run this once after creating the table, and again whenever
+customers were created in Nibo outside the integration.
+
+Usage:
+    python build_stakeholder_index.py
+"""
+
+import sys
+from api.db import get_db_session
+from api.nibo.stakeholders import build_stakeholder_index
+
+def main():
+    print("Stakeholder Index Build")
+    print("=" * 40)
+
+    session = get_db_session()
+    if not session:
+        print("❌ Database unavailable")
+        sys.exit(1)
+
+    try:
+        summary = build_stakeholder_index(session)
+    except Exception as e:
+        print(f"❌ Build failed: {e}")
+        sys.exit(1)
+    finally:
+        session.close()
+
+    print(f"✅ Indexed {summary['indexed']} of {summary['customers']} customers")
+
+    if summary["duplicates"]:
+        print(f"⚠️  {summary['duplicates']} customers share a normalized name with another one and were not indexed")
+
+if __name__ == "__main__":
+    main()
@@ -43,7 +43,7 @@ def test_connection():
                 SELECT table_name 
                 FROM information_schema.tables 
                 WHERE table_schema = 'public' 
-                AND table_name IN ('requests', 'logs')
+                AND table_name IN ('requests', 'logs', 'schedule_map', 'deferred_events', 'nibo_outbox', 'sync_state', 'synced_reservations', 'reservation_mirror', 'stays_catalog', 'entity_map', 'stakeholder_index', 'profiles')
                 ORDER BY table_name
             """))
             
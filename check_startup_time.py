@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Cold Start Import Time Check
+
+Imports the Vercel function (api.index) in fresh interpreters with
+`-X importtime`, writes the raw report of the fastest run to
+importtime-report.txt and fails if the cold import exceeds the budget or if
+modules that must stay lazy (the DB layer) are imported at startup.
+
+Usage:
+    python check_startup_time.py [BUDGET_MS]
+
+The budget can also be set with STARTUP_BUDGET_MS (default: 1500).
+"""
+
+import os
+import subprocess
+import sys
+
+ENTRYPOINT = "api.index"
+RUNS = 5
+DEFAULT_BUDGET_MS = 1500
+REPORT_PATH = os.getenv("STARTUP_REPORT_PATH", "importtime-report.txt")
+
+# Modules that must not be imported just by loading the function
+LAZY_MODULES = ("sqlmodel", "sqlalchemy", "psycopg2", "dotenv")
+
+def measure():
+    """Run one cold import and return (total_us, {module: cumulative_us}, raw report)."""
+    env = dict(os.environ, VERCEL="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRYPOINT}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+    if result.returncode != 0:
+        print(result.stderr)
+        raise SystemExit(f"❌ Importing {ENTRYPOINT} failed")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(cumulative)
+        except ValueError:
+            continue
+
+    return modules.get(ENTRYPOINT, 0), modules, result.stderr
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else float(os.getenv("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+
+    print("Cold Start Import Time Check")
+    print("=" * 40)
+
+    best = None
+    for _ in range(RUNS):
+        run = measure()
+        if best is None or run[0] < best[0]:
+            best = run
+
+    total_us, modules, report = best
+
+    with open(REPORT_PATH, "w") as f:
+        f.write(report)
+
+    print(f"Best of {RUNS} cold imports of {ENTRYPOINT}: {total_us / 1000:.1f} ms (budget {budget_ms:.0f} ms)")
+    print(f"Full report written to {REPORT_PATH}")
+    print("-" * 40)
+    print("Slowest top-level imports (cumulative):")
+
+    top_level = {name: us for name, us in modules.items() if "." not in name.strip()}
+    for name, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:15]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failures = []
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        failures.append(f"lazy modules imported at startup: {', '.join(eager)}")
+
+    if total_us / 1000 > budget_ms:
+        failures.append(f"cold import took {total_us / 1000:.1f} ms, over the {budget_ms:.0f} ms budget")
+
+    if failures:
+        for failure in failures:
+            print(f"\n❌ {failure}")
+        sys.exit(1)
+
+    print("\n✅ Cold start within budget.")
+
+if __name__ == "__main__":
+    main()
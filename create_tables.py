@@ -19,7 +19,7 @@ Make sure your .env file is properly configured with PostgreSQL connection detai
 import sys
 from sqlmodel import SQLModel, create_engine
 from api.constants import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME
-from api.utils import Requests, Logs
+from api.models import Requests, Logs, ScheduleMap, DeferredEvents, NiboOutbox, SyncState, SyncedReservations, ReservationMirror, StaysCatalog, EntityMap, StakeholderIndex, Profiles
 
 def create_database_tables():
     """Create all database tables defined in the application."""
@@ -46,6 +46,16 @@ def create_database_tables():
         print("\nTables created:")
         print("- requests: Stores incoming webhook requests")
         print("- logs: Stores processing logs and tracking information")
+        print("- schedule_map: Maps reservations to their Nibo schedule IDs")
+        print("- deferred_events: Webhook events waiting for an upstream to recover")
+        print("- nibo_outbox: Nibo schedules queued for creation")
+        print("- sync_state: Progress of the reservations-export sync")
+        print("- synced_reservations: Last synced export hash of each reservation")
+        print("- reservation_mirror: Local copy of Stays reservations and export reports")
+        print("- stays_catalog: Cached Stays listings and clients")
+        print("- entity_map: Maps Stays listings and clients to Nibo cost centers and suppliers")
+        print("- stakeholder_index: Nibo customers by normalized name")
+        print("- profiles: Sampled profiles of slow webhook runs")
         
         # Test the connection by trying to connect
         with engine.connect() as connection:
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Profile Export Script
+
+Writes a stored webhook profile (see api/profiling.py) as a folded-stacks
+file, which speedscope (https://www.speedscope.app), flamegraph.pl or
+inferno open as a flame graph. Without arguments it lists the slowest
+profiles.
+
+Usage:
+    python export_profile.py [--list N]
+    python export_profile.py <profile_id> [--output profile.folded]
+    python export_profile.py --log-id <logs id> [--output profile.folded]
+"""
+
+import argparse
+import sys
+from sqlmodel import select
+from api.db import get_db_session
+from api.models import Profiles
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a stored profile as folded stacks")
+    parser.add_argument("profile_id", nargs="?", type=int)
+    parser.add_argument("--log-id", type=int, help="export the profile of this logs row")
+    parser.add_argument("--list", type=int, default=20, help="without an id, how many of the slowest profiles to list")
+    parser.add_argument("--output", help="file to write (default profile-<id>.folded)")
+    args = parser.parse_args()
+
+    session = get_db_session()
+    if not session:
+        print("❌ Database unavailable")
+        sys.exit(1)
+
+    try:
+        if args.profile_id is None and args.log_id is None:
+            profiles = session.exec(select(Profiles).order_by(Profiles.elapsed_ms.desc()).limit(args.list)).all()
+            print("Slowest profiles")
+            print("=" * 40)
+            for profile in profiles:
+                print(f"#{profile.id} log {profile.log_id} {profile.action} {profile.dt}: {profile.elapsed_ms} ms, {profile.samples} samples ({profile.trigger})")
+            return
+
+        if args.profile_id is not None:
+            profile = session.get(Profiles, args.profile_id)
+        else:
+            profile = session.exec(select(Profiles).where(Profiles.log_id == args.log_id)).first()
+    except Exception as e:
+        print(f"❌ Could not read profiles: {e}")
+        sys.exit(1)
+    finally:
+        session.close()
+
+    if profile is None:
+        print("❌ Profile not found")
+        sys.exit(1)
+
+    output = args.output or f"profile-{profile.id}.folded"
+    with open(output, "w") as f:
+        f.write(profile.stacks + "\n")
+
+    print(f"✅ {profile.action} ({profile.elapsed_ms} ms, {profile.samples} samples) written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Stays <-> Nibo Reconciliation Script
+
+Compares the schedules in Nibo with what the integration would produce from
+the current Stays data for a window of check-in dates, and prints the diff
+(missing, extra, duplicate and value-mismatched schedules). The same report
+runs nightly through /api/cron/reconcile-nibo.
+
+Usage:
+    python reconcile_nibo.py [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--output report.json] [--apply] [--delete-extra]
+
+Without dates the window is the last 30 days to 60 days ahead. --apply fixes
+missing, duplicate and mismatched schedules; --delete-extra also deletes the
+extra ones.
+"""
+
+import argparse
+import json
+import sys
+from api.reconciliation import reconcile, apply_diff
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile Nibo schedules against Stays")
+    parser.add_argument("--from", dest="from_date")
+    parser.add_argument("--to", dest="to_date")
+    parser.add_argument("--output", help="write the full diff report to this JSON file")
+    parser.add_argument("--apply", action="store_true", help="fix the discrepancies found")
+    parser.add_argument("--delete-extra", action="store_true", help="with --apply, also delete extra schedules")
+    args = parser.parse_args()
+
+    if bool(args.from_date) != bool(args.to_date):
+        parser.error("--from and --to go together")
+
+    print("Stays <-> Nibo Reconciliation")
+    print("=" * 40)
+
+    try:
+        report, context = reconcile(args.from_date, args.to_date)
+    except Exception as e:
+        print(f"❌ Reconciliation failed: {e}")
+        sys.exit(1)
+
+    print(f"Window: {report['window'][0]} -> {report['window'][1]}")
+    for key, value in report["summary"].items():
+        print(f"{key}: {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Full report written to {args.output}")
+
+    discrepancies = sum(report["summary"][key] for key in ("missing", "extra", "duplicate", "mismatch"))
+
+    if not args.apply:
+        if discrepancies:
+            print(f"\n⚠️  {discrepancies} discrepancies found. Run with --apply to fix them.")
+            sys.exit(1)
+        print("\n✅ Nibo matches Stays.")
+        return
+
+    print("-" * 40)
+    results = apply_diff(report, context, delete_extra=args.delete_extra)
+    failed = [reservation_id for reservation_id, log in results.items() if any("error" in entry for entry in log)]
+
+    print(f"Fixed {len(results) - len(failed)} reservation(s)")
+    if failed:
+        print(f"❌ Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+    print("\n✅ Discrepancies applied.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Schedule Map Reconciliation Script
+
+Deletes duplicate schedules of mapped reservations and verifies the
+reservation -> Nibo schedule ID mapping against Nibo, repointing rows whose
+schedules were replaced and dropping rows whose schedules are gone.
+The same job runs periodically through /api/cron/reconcile-schedule-map.
+
+Usage:
+    python reconcile_schedule_map.py [LIMIT]
+"""
+
+import sys
+from api.db import get_db_session
+from api.nibo.transaction import reconcile_reservation_schedules
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    print("Schedule Map Reconciliation")
+    print("=" * 40)
+
+    session = get_db_session()
+    if not session:
+        print("❌ Database unavailable")
+        sys.exit(1)
+
+    try:
+        totals = reconcile_reservation_schedules(session, limit=limit)
+    finally:
+        session.close()
+
+    for key, value in totals.items():
+        print(f"{key}: {value}")
+
+    if totals["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Log Spool Replay Script
+
+Loads the request/log rows spooled to disk while the database was down
+(LOG_SPOOL_DIR, default /tmp/stays-nibo-log-spool) into the requests and
+logs tables. The app also replays its own spool after its next successful
+log write; this script drains the spool of a local or long-running server.
+
+Usage:
+    python replay_log_spool.py
+"""
+
+import sys
+from api.constants import LOG_SPOOL_DIR
+from api.db import get_db_session
+from api.spool import replay_spool, spool_pending
+
+def main():
+    print("Log Spool Replay")
+    print("=" * 40)
+    print(f"Spool directory: {LOG_SPOOL_DIR}")
+
+    if not spool_pending():
+        print("✅ Nothing to replay")
+        return
+
+    session = get_db_session()
+    if not session:
+        print("❌ Database unavailable")
+        sys.exit(1)
+
+    try:
+        totals = {"segments": 0, "rows": 0, "bad_segments": 0}
+        while spool_pending():
+            batch = replay_spool(session, max_rows=5000)
+            if not batch["segments"] and not batch["bad_segments"]:
+                break
+            for key in totals:
+                totals[key] += batch[key]
+    except Exception as e:
+        print(f"❌ Replay failed: {e}")
+        sys.exit(1)
+    finally:
+        session.close()
+
+    print(f"✅ Replayed {totals['rows']} rows from {totals['segments']} segments")
+
+    if totals["bad_segments"]:
+        print(f"⚠️  {totals['bad_segments']} segments were rejected by the database and renamed to *.bad in {LOG_SPOOL_DIR}")
+
+    if spool_pending():
+        print("⚠️  Some segments are still being written; run again shortly.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Webhook Traffic Replay Script
+
+Replays the webhook events stored in the requests table through the
+pipeline, in time order, and reports throughput, latency percentiles and
+upstream calls per event. Nothing is written to Nibo or to the database.
+
+Usage:
+    python replay_requests.py [--from DT] [--to DT] [--limit N] [--speed N] [--workers N] [--stand-ins [--latency-ms MS]] [--output results.json]
+
+By default reads go to the real Stays and Nibo and writes are only recorded
+(dry run). --stand-ins replaces both with local stand-ins fed from the
+replayed payloads and the reservation mirror, so no network is used;
+--latency-ms adds a fixed delay to each stand-in call. --speed N keeps the
+original spacing of the events divided by N (0, the default, sends them as
+fast as the workers allow).
+"""
+
+import argparse
+import json
+import sys
+from api.db import get_db_session
+from api.index import handle_event
+from api.replay import load_events, load_mirrored_reports, replay, StandIns
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged webhook traffic")
+    parser.add_argument("--from", dest="from_dt", help="first request dt (ISO)")
+    parser.add_argument("--to", dest="to_dt", help="last request dt (ISO)")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--speed", type=float, default=0, help="N x the original pace; 0 = as fast as possible")
+    parser.add_argument("--workers", type=int, default=8, help="events processed concurrently")
+    parser.add_argument("--stand-ins", action="store_true", help="use local Stays and Nibo stand-ins instead of the network")
+    parser.add_argument("--latency-ms", type=float, default=0, help="with --stand-ins, delay added to each call")
+    parser.add_argument("--output", help="write the summary and per-event results to this JSON file")
+    args = parser.parse_args()
+
+    print("Webhook Traffic Replay")
+    print("=" * 40)
+
+    session = get_db_session()
+    if not session:
+        print("❌ Database unavailable")
+        sys.exit(1)
+
+    try:
+        events = load_events(session, args.from_dt, args.to_dt, args.limit)
+        stand_ins = None
+        if args.stand_ins:
+            reports = load_mirrored_reports(session, {event["payload"].get("_id") for event in events if event["payload"].get("_id")})
+            stand_ins = StandIns(reports, latency_ms=args.latency_ms)
+            print(f"Stand-ins loaded with {len(reports)} mirrored export reports")
+    except Exception as e:
+        print(f"❌ Could not load events: {e}")
+        sys.exit(1)
+    finally:
+        session.close()
+
+    if not events:
+        print("✅ No events to replay")
+        return
+
+    print(f"Replaying {len(events)} events ({'stand-ins' if stand_ins else 'dry run'}, speed {args.speed or 'max'}, {args.workers} workers)")
+    print("-" * 40)
+
+    summary, results = replay(events, handle_event, stand_ins=stand_ins, speed=args.speed, workers=args.workers)
+
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "events": results}, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Results written to {args.output}")
+
+    failed = summary["outcomes"].get("failed", 0)
+    if failed:
+        print(f"\n⚠️  {failed} events failed")
+    else:
+        print("\n✅ Replay complete")
+
+if __name__ == "__main__":
+    main()
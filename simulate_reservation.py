@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Reservation Dry-Run Script
+
+Runs reservations through the full creation pipeline (DTO, Expedia split,
+category and due-date rules, diff against the existing Nibo schedules)
+without writing anything: the Nibo writes are recorded and printed instead
+of sent, and no database is used.
+
+Usage:
+    python simulate_reservation.py <reservation_id> [<reservation_id> ...] [--repeat N] [--output result.json]
+    python simulate_reservation.py --payload payloads.json [--repeat N] [--output result.json]
+
+--payload takes a reservation payload, a webhook body ({"payload": ...}) or
+a list of either. --repeat runs each reservation N times and reports the
+mean time, for benchmarking.
+"""
+
+import argparse
+import json
+import sys
+from api.index import simulate_reservation_creation
+from api.stays.index import get_reservation
+
+def load_payloads(path):
+    with open(path) as f:
+        data = json.load(f)
+
+    items = data if isinstance(data, list) else [data]
+    return [item["payload"] if "payload" in item else item for item in items]
+
+def main():
+    parser = argparse.ArgumentParser(description="Dry-run reservations through the pipeline")
+    parser.add_argument("reservation_ids", nargs="*")
+    parser.add_argument("--payload", help="JSON file with reservation payloads instead of fetching them")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per reservation")
+    parser.add_argument("--output", help="write every result, with its writes and track log, to this JSON file")
+    args = parser.parse_args()
+
+    if not args.reservation_ids and not args.payload:
+        parser.error("give reservation ids or --payload")
+
+    print("Reservation Dry Run")
+    print("=" * 40)
+
+    try:
+        reservations = load_payloads(args.payload) if args.payload else [get_reservation(reservation_id) for reservation_id in args.reservation_ids]
+    except Exception as e:
+        print(f"❌ Could not load reservations: {e}")
+        sys.exit(1)
+
+    results = []
+    failed = 0
+    total_writes = 0
+
+    for reservation in reservations:
+        runs = [simulate_reservation_creation(reservation) for _ in range(max(args.repeat, 1))]
+        run = runs[-1]
+        mean_ms = sum(item["elapsed_ms"] for item in runs) / len(runs)
+
+        writes = {}
+        for write in run["writes"]:
+            writes[write["method"]] = writes.get(write["method"], 0) + 1
+        total_writes += len(run["writes"])
+
+        ok = run["result"] is not False and not run["errors"]
+        if not ok:
+            failed += 1
+
+        status = "✅" if ok else "❌"
+        print(f"{status} {reservation.get('id', reservation.get('_id'))}: {len(run['writes'])} write(s) {writes or ''} in {mean_ms:.1f} ms")
+        for error in run["errors"]:
+            print(f"   - {error}")
+
+        results.append({"reservation_id": reservation.get("id"), "mean_ms": mean_ms, **run})
+
+    print("-" * 40)
+    print(f"Reservations: {len(reservations)}, would-be writes: {total_writes}, failed: {failed}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Results written to {args.output}")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()